@@ -1,24 +1,37 @@
 import os
 import datetime
 from telebot import TeleBot, types
+from telebot.apihelper import ApiTelegramException
 import redis
 import logging
 from geopy.distance import geodesic
 import mysql.connector
-from mysql.connector import pooling
-import re
-from math import radians, sin, cos, sqrt, atan2
 import time
+import threading
+import asyncio
+import multiprocessing
+import socket
 import json
 import base64
-
-logging.basicConfig(filename="logs.txt",
-                    filemode="a",
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    level=logging.DEBUG)
+from spatial_index import SpatialIndex
+from search_cache import SearchCache
+from session_store import SessionStore
+from runtime import PollingRuntime, WebhookRuntime, StreamWorker, RedisUpdateQueue
+from next_steps import SessionStepBackend
+import distance
+from place_details import fetch_place_detail, fetch_place_overlay, fetch_place_reviews, update_photo_file_ids
+from place_cards import CardCache, PlaceCard, build_card_template, render_card, PLACES_UPDATED_CHANNEL
+from opening_hours import is_open_now, is_open_at, current_minute_of_week
+import photo_store
+from log_config import LOG_FILE, configure_logging, worker_log_file
+from db_pool import ConnectionPool
+from metrics import InstrumentedPool, instrument_redis, instrument_bot_api, handler_timer, timed_handler, start_metrics_server
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
-redis_client = redis.Redis()
+redis_client = instrument_redis(redis.Redis())
+sessions = SessionStore(redis_client, ttl_seconds=int(os.environ.get("SESSION_TTL_SECONDS", 24 * 60 * 60)))
 
 db_config = {
     "host": "localhost",
@@ -27,13 +40,26 @@ db_config = {
     "database": "PlacesExploration"
 }
 
-pool = pooling.MySQLConnectionPool(pool_name="RestAppPool", pool_size=20, **db_config)
+pool_size = int(os.environ.get("MYSQL_POOL_SIZE", 20))
+pool = InstrumentedPool(ConnectionPool(pool_name="RestAppPool", pool_size=pool_size,
+                                      max_overflow=int(os.environ.get("MYSQL_POOL_OVERFLOW", 10)),
+                                      timeout=float(os.environ.get("MYSQL_POOL_TIMEOUT", 5)),
+                                      recycle_seconds=int(os.environ.get("MYSQL_POOL_RECYCLE_SECONDS", 3600)),
+                                      idle_seconds=int(os.environ.get("MYSQL_POOL_IDLE_SECONDS", 300)),
+                                      **db_config))
+
+place_index = SpatialIndex()
+place_index.load(pool)
+place_index.start_auto_refresh(pool, int(os.environ.get("SPATIAL_INDEX_REFRESH_SECONDS", 3600)))
+
+card_cache = CardCache(max_size=int(os.environ.get("CARD_CACHE_SIZE", 10000)),
+                       ttl_seconds=int(os.environ.get("CARD_CACHE_TTL", 3600)))
+
+distance_mode = os.environ.get("DISTANCE_MODE", distance.HAVERSINE)
+geodesic_top_n = int(os.environ.get("GEODESIC_TOP_N", 5))
 
 def generate_map_link(place_id):
-    logger.debug(f"Generating map link for place ID: {place_id}")
-    map_url = f"https://www.google.com/maps/search/?api=1&query=Google&query_place_id={place_id}"
-    logger.debug(f"Generated map link: {map_url}")
-    return map_url
+    return f"https://www.google.com/maps/search/?api=1&query=Google&query_place_id={place_id}"
 
 def extract_address(full_address):
     parts = full_address.split(',')
@@ -55,21 +81,6 @@ def number_to_emoji(number):
     }
     return ''.join(digit_to_emoji[digit] for digit in str(number))
 
-def haversine(lat1, lon1, lat2, lon2):
-
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    distance = 6371 * c * 1000
-    return distance
-
-def is_in_range(user_lat, user_lon, place_lat, place_lon, range_meters):
-    distance = haversine(user_lat, user_lon, place_lat, place_lon)
-    return distance <= range_meters
-
 def compute_distance(lat1, lon1, lat2, lon2):
     point1 = (lat1, lon1)
 
@@ -78,126 +89,50 @@ def compute_distance(lat1, lon1, lat2, lon2):
     distance = geodesic(point1, point2).meters
     return distance
 
-def get_places_in_bounding_box(user_lat, user_lon, range_meters):
-    lat_delta = range_meters / 111111
-    lon_delta = range_meters / (111111 * cos(radians(user_lat)))
-    min_lat = user_lat - lat_delta
-    max_lat = user_lat + lat_delta
-    min_lon = user_lon - lon_delta
-    max_lon = user_lon + lon_delta
-
-    connection = pool.get_connection()
-
-    try:
-        cursor = connection.cursor()
-
-        query = """
-        SELECT place_id, latitude, longitude
-        FROM Places
-        WHERE latitude BETWEEN %s AND %s
-        AND longitude BETWEEN %s AND %s
-        """
-
-        cursor.execute(query, (min_lat, max_lat, min_lon, max_lon))
-        places_in_bounding_box = cursor.fetchall()
-        cursor.close()
-    finally:
-        connection.close()
-
-    return places_in_bounding_box
-
-def replace_weekdays(text):
-    logger.debug(f"Replacing weekdays in text: {text}")
-    weekdays = {
-        "Monday": "Понеділок",
-        "Tuesday": "Вівторок",
-        "Wednesday": "Середа",
-        "Thursday": "Четвер",
-        "Friday": "П'ятниця",
-        "Saturday": "Субота",
-        "Sunday": "Неділя",
-    }
-
-    for weekday, ukrainian_weekday in weekdays.items():
-        pattern = rf"\b{weekday}\b"
-        logger.debug(f"Replacing '{weekday}' with '{ukrainian_weekday}'")
-        text = re.sub(pattern, ukrainian_weekday, text, flags=re.IGNORECASE)
-
-    logger.debug(f"Weekday replacement completed. Text after replacement: {text}")
-    return text
+def get_search_candidates(latitude, longitude, search_radius, type):
+    cell = search_cache.cell_for(latitude, longitude)
+    radius_bucket = search_cache.radius_bucket(search_radius)
+    place_ids = search_cache.get(cell, radius_bucket, type)
+    if place_ids is not None:
+        return [place for place in map(place_index.get, place_ids) if place is not None]
+
+    center_lat, center_lon = search_cache.cell_center(cell)
+    cell_radius = radius_bucket + search_cache.cell_radius_meters
+    candidates = [place for place in place_index.candidates(center_lat, center_lon, cell_radius) if type in place[4]]
+    if candidates:
+        order, _ = distance.rank_within_range(center_lat, center_lon, [place[1] for place in candidates],
+                                              [place[2] for place in candidates], cell_radius, mode=distance.EQUIRECTANGULAR)
+        candidates = [candidates[index] for index in order.tolist()]
+    search_cache.set(cell, radius_bucket, type, [place[0] for place in candidates])
+    return candidates
+
+def get_places(latitude, longitude, search_radius, keywords, type, open_only=False):
+    logger.info(f"Get places triggered {latitude}, {longitude}, {search_radius}, {keywords}, {type}, open_only={open_only}")
+    candidates = get_search_candidates(latitude, longitude, search_radius, type)
+    if open_only:
+        minute_of_week = current_minute_of_week()
+        candidates = [place for place in candidates if place[6] and is_open_at(place[6], minute_of_week)]
+    if not candidates:
+        return []
+    lats = [place[1] for place in candidates]
+    lons = [place[2] for place in candidates]
+    order, distances = distance.rank_within_range(latitude, longitude, lats, lons, search_radius,
+                                                  mode=distance_mode, geodesic_top_n=geodesic_top_n)
+    places = []
+    for index, place_distance in zip(order.tolist(), distances.tolist()):
+        place_id, place_lat, place_lon, name, types, formatted_address, open_intervals = candidates[index]
+        places.append({"place_id": place_id, "name": name, "distance": place_distance, "formatted_address": formatted_address})
+    return places
 
-def is_favourite(place_id, tg_user_id):
-    try:
-        conn = pool.get_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        query = """
-        SELECT COUNT(*) as count
-        FROM Favourites
-        WHERE place_id = %s AND tg_user_id = %s
-        """
-        cursor.execute(query, (place_id, tg_user_id))
-        result = cursor.fetchone()
-        
-        is_fav = result['count'] > 0
-        
-        return is_fav
-    
-    except mysql.connector.Error as err:
-        logger.error(f"Error: {err}")
-        return False
-    
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-            
-def is_open_now(data):
-    now = datetime.datetime.now()
-    current_day = now.weekday()
-    current_time = now.strftime("%H%M")
-
-    for period in data["periods"]:
-        if period["open"]["day"] <= current_day:
-            if "close" in period and period["close"]["day"] >= current_day:
-                if period["open"]["day"] > period["close"]["day"]:
-                    if current_time >= period["open"]["time"] or current_time < period["close"]["time"]:
-                        return True
-                else:
-                    if current_time >= period["open"]["time"]:
-                        return True
-            else:
-                return True
-
-    return False
-
-def get_places(latitude, longitude, search_radius, keywords, type):
-    logger.info(f"Get places triggered {latitude}, {longitude}, {search_radius}, {keywords}, {type}")
-    places_in_bounding_box = get_places_in_bounding_box(latitude, longitude, search_radius)
+def resolve_place_refs(place_refs):
     places = []
-    connection = pool.get_connection()
-    try:
-        for place_id, place_lat, place_lon in places_in_bounding_box:
-            if is_in_range(latitude, longitude, place_lat, place_lon, search_radius):
-                query = f"SELECT name, types, formatted_address FROM Places WHERE place_id = '{place_id}'"
-
-                if connection.is_connected():
-                    cursor = connection.cursor()
-                    cursor.execute(query)
-                    place = cursor.fetchall()[0]
-                    cursor.close()
-                else:
-                    logger.error(f"Error while get_places, connection is not connected: {e}")
-
-                name = place[0]
-                if type in place[1]:
-                    places.append({"place_id": place_id, "name": name, "distance": compute_distance(latitude, longitude, place_lat, place_lon), "formatted_address": place[2]})
-    finally:
-        connection.close()
-
-    sorted_places = sorted(places, key=lambda x: x['distance'])
-    return sorted_places
+    for place_id, place_distance in place_refs:
+        entry = place_index.get(place_id)
+        if entry is None:
+            logger.warning(f"Place {place_id} from session is missing in the spatial index")
+            continue
+        places.append({"place_id": place_id, "name": entry[3], "distance": place_distance, "formatted_address": entry[5]})
+    return places
 
 def convert_relative_time(description):
     if description == "in the last week":
@@ -228,36 +163,11 @@ def convert_relative_time(description):
     return (datetime.datetime.now() - time_units[unit]).date()
 
 def get_place_reviews(place_id):
-    query = f"SELECT id, name, score, review, date FROM UsersReviews WHERE place_id = '{place_id}'"
-    reviews = []
-
-    connection = pool.get_connection()
-    try:
-        if connection.is_connected():
-            cursor = connection.cursor()
-            cursor.execute(query)
-            user_reviews = cursor.fetchall()
-            cursor.close()
-    finally:
-        connection.close()
-
-    for elem in user_reviews:
-        reviews.append({"author_name": elem[1], "rating": elem[2], "date": elem[4].strftime('%d.%m.%Y'), "text": elem[3]})
-    reviews = sorted(reviews, key=lambda x: datetime.datetime.strptime(x['date'], '%d.%m.%Y'), reverse=True)
-    query = f"SELECT reviews FROM Places WHERE place_id = '{place_id}'"
-
-    connection = pool.get_connection()
-    try:
-        if connection.is_connected():
-            cursor = connection.cursor()
-            cursor.execute(query)
-            reviews_str = cursor.fetchall()[0][0]
-            cursor.close()
-    finally:
-        connection.close()
+    user_reviews, reviews_str = fetch_place_reviews(pool, place_id)
+    reviews = [{"author_name": elem[1], "rating": elem[2], "date": elem[4].strftime('%d.%m.%Y'), "text": elem[3]}
+               for elem in user_reviews]
 
-
-    reviews_google = json.loads(reviews_str)
+    reviews_google = json.loads(reviews_str) if reviews_str else None
 
     if reviews_google is None:
         return None
@@ -269,235 +179,80 @@ def get_place_reviews(place_id):
         reviews.append(review)
     return reviews
 
-def get_photos_for_place(place_id):
-    logger.debug(f"Fetching photos for place ID: {place_id}")
-    connection = pool.get_connection()
-    cursor = connection.cursor()
-    try:
-        query = "SELECT photo_data FROM PlacePhotos WHERE place_id = %s"
-        cursor.execute(query, (place_id,))
-        photos = cursor.fetchall()
-        photo_list = [photo[0] for photo in photos]
-        logger.debug(f"Fetched {len(photo_list)} photos for place ID: {place_id}")
-        return photo_list
-    except mysql.connector.Error as err:
-        logger.error(f"Error fetching photos for place ID {place_id}: {err}")
-        return []
-    finally:
-        cursor.close()
-        connection.close()
-
-def get_detailed_place_info(place_id, latitude, longitude, user_id):
-
-    connection = pool.get_connection()
-    try:
-        if connection.is_connected():
-            query = f"SELECT place_id, latitude, longitude, name, formatted_address, weekday_text, rating, price_level, url, website, serves_beer, serves_breakfast, serves_brunch, serves_dinner, serves_lunch, serves_vegetarian_food, serves_wine, opening_hours, photos, types, dine_in, delivery, reservable, reviews, international_phone_number FROM Places WHERE place_id = '{place_id}'"
-            cursor = connection.cursor()
-            cursor.execute(query)
-            place = cursor.fetchall()[0]
-
-            query = f"SELECT place_id FROM Favourites WHERE tg_user_id={user_id}"
-            cursor.execute(query)
-            favourite_places_db = cursor.fetchall()
-            cursor.close()
-    finally:
-        connection.close()
-
-
-    favourite_places = []
-    for info in favourite_places_db:
-        favourite_places.append(info[0])
-    open_now = None
-    if place[17] is not None:
-        opening_hours = json.loads(place[17])
-        if opening_hours is not None:
-            if is_open_now(opening_hours):
-                open_now = True
-            else:
-                open_now = False
-    place_data = {
-                    "name": place[3],
-                    "address": place[4],
-                    "weekday_text": place[5],
-                    "distance": compute_distance(latitude, longitude, place[1], place[2]),
-                    "rating": place[6],
-                    "price_level": place[7],
-                    "place_id" : place_id,
-                    "url": place[8],
-                    "website": place[9],
-                    "serves_beer": place[10],
-                    "serves_breakfast": place[11],
-                    "serves_brunch": place[12],
-                    "serves_dinner": place[13],
-                    "serves_lunch": place[14],
-                    "serves_vegetarian_food": place[15],
-                    "serves_wine": place[16],
-                    "open_now": open_now,
-                    "photos": json.loads(place[18]),
-                    "types": place[19],
-                    "dine_in": place[20],
-                    "delivery": place[21],
-                    "reservable": place[22],
-                    "reviews": place[23],
-                    "international_phone_number": place[24]
-                }
-
-    logger.info(f"{place_data}")
-
-    address = str(place_data['address'])
-    response = ''
-    response += f"☕️ {place_data['name']}" + ("⭐️\n\n" if place_id in favourite_places else "\n\n")
-    response += f"📍 Адреса: {address}\n"
-    response += f"📞 Номер телефону: {place_data['international_phone_number'].replace(' ', '')}\n" if place_data['international_phone_number'] is not None else ''
-    response += f"🕒 Статус роботи: {'Відкрито' if place_data['open_now'] else 'Закрито'}\n"
-    response += f"📏 Відстань: {int(place_data['distance'])} метрів\n"
-    response += f"⭐ Рейтинг: {place_data['rating'] if place_data['rating'] is not None else 'Невідомо 😕'}\n"
-    response += f"💰 Рівень Ціни: {place_data['price_level']}\n" if place_data['price_level'] is not None else ''
-    response += '🪑 Є місця всередині\n' if place_data.get('dine_in', False) else ''
-    response += '🚚 Є доставка\n' if place_data.get('delivery', False) else ''
-    response += '📅 Можливе бронювання\n' if place_data.get('reservable', False) else ''
-
-    response += "\n🕓 Графік роботи:\n"
-    if place_data["weekday_text"]:
-        if "⏳ Графік роботи невідомий 😕" in place_data["weekday_text"]:
-            response += " невідомо 😕"
-        else:
-            response += place_data['weekday_text']
-    response = replace_weekdays(response).replace("Closed", "Зачинено 🔒")
-    map_link = generate_map_link(place_data["place_id"])
-    website = place_data["website"]
-    return (response, map_link, website, get_photos_for_place(place_id))
-
-def get_detailed_place_info_without_distance(place_id, user_id):
-    connection = pool.get_connection()
-    try:
-        if connection.is_connected():
-            query = f"SELECT place_id, latitude, longitude, name, formatted_address, weekday_text, rating, price_level, url, website, serves_beer, serves_breakfast, serves_brunch, serves_dinner, serves_lunch, serves_vegetarian_food, serves_wine, opening_hours, photos, types, dine_in, delivery, reservable, reviews, international_phone_number FROM Places WHERE place_id = '{place_id}'"
-            cursor = connection.cursor()
-            cursor.execute(query)
-            place = cursor.fetchall()[0]
-            query = f"SELECT place_id FROM Favourites WHERE tg_user_id={user_id}"
-            cursor.execute(query)
-            favourite_places_db = cursor.fetchall()
-            cursor.close()
-    except Exception as e:
-        logger.error(f"Error while get_detailed_place_info_without_distance: {e}")
-    finally:
-        connection.close()
-
-    favourite_places = []
-    for info in favourite_places_db:
-        favourite_places.append(info[0])
-    open_now = None
-    if place[17] is not None:
-        opening_hours = json.loads(place[17])
-        if opening_hours is not None:
-            if is_open_now(opening_hours):
-                open_now = True
-            else:
-                open_now = False
-    place_data = {
-                    "name": place[3],
-                    "address": place[4],
-                    "weekday_text": place[5],
-                    "rating": place[6],
-                    "price_level": place[7],
-                    "place_id" : place_id,
-                    "url": place[8],
-                    "website": place[9],
-                    "serves_beer": place[10],
-                    "serves_breakfast": place[11],
-                    "serves_brunch": place[12],
-                    "serves_dinner": place[13],
-                    "serves_lunch": place[14],
-                    "serves_vegetarian_food": place[15],
-                    "serves_wine": place[16],
-                    "open_now": open_now,
-                    "photos": json.loads(place[18]),
-                    "types": place[19],
-                    "dine_in": place[20],
-                    "delivery": place[21],
-                    "reservable": place[22],
-                    "reviews": place[23],
-                    "international_phone_number": place[24]
-                }
-
-    address = str(place_data['address'])
-    response = ''
-    response += f"☕️ {place_data['name']}" + ("⭐️\n\n" if place_id in favourite_places else "\n\n")
-    response += f"📍 Адреса: {address}\n"
-    response += f"📞 Номер телефону: {place_data['international_phone_number'].replace(' ', '')}\n" if place_data['international_phone_number'] is not None else ''
-    response += f"🕒 Статус роботи: {'Відкрито' if place_data['open_now'] else 'Закрито'}\n"
-    response += f"⭐ Рейтинг: {place_data['rating'] if place_data['rating'] is not None else 'Невідомо 😕'}\n"
-    response += f"💰 Рівень Ціни: {place_data['price_level']}\n" if place_data['price_level'] is not None else ''
-    response += '🪑 Є місця всередині\n' if place_data.get('dine_in', False) else ''
-    response += '🚚 Є доставка\n' if place_data.get('delivery', False) else ''
-    response += '📅 Можливе бронювання\n' if place_data.get('reservable', False) else ''
-
-    response += "\n🕓 Графік роботи:\n"
-    
-    if place_data["weekday_text"]:
-        if "⏳ Графік роботи невідомий 😕" in place_data["weekday_text"]:
-            response += " невідомо 😕"
-        else:
-            response += place_data['weekday_text']
-    response = replace_weekdays(response).replace("Closed", "Зачинено 🔒")
-    map_link = generate_map_link(place_data["place_id"])
-    website = place_data["website"]
-    return (response, map_link, website, get_photos_for_place(place_id))
+def get_place_card(place_id, user_id, latitude=None, longitude=None):
+    template = card_cache.get(place_id)
+    if template is None:
+        detail = fetch_place_detail(pool, place_id, user_id)
+        if detail is None:
+            logger.error(f"Place {place_id} not found")
+            return None, None
+        template = build_card_template(detail)
+        card_cache.set(template)
+        is_favourite, photos = detail.is_favourite, detail.photos
+    else:
+        is_favourite, photos = fetch_place_overlay(pool, place_id, user_id)
+    place_distance = None
+    if latitude is not None and longitude is not None:
+        place_distance = compute_distance(float(latitude), float(longitude), template.latitude, template.longitude)
+    card = PlaceCard(place_id, template.website, is_favourite, photos)
+    return card, render_card(template, is_favourite, is_open_now(template.open_intervals), place_distance)
+
+def listen_for_place_updates():
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(PLACES_UPDATED_CHANNEL)
+            for message in pubsub.listen():
+                place_ids = message["data"].decode("utf-8").split(",")
+                card_cache.invalidate(place_ids)
+                place_index.refresh(pool, place_ids)
+                search_cache.invalidate()
+        except Exception as e:
+            logger.error(f"Error while listening for place updates: {e}")
+            time.sleep(5)
 
 def store_user_location(user_id, latitude, longitude):
-    connection = pool.get_connection()
-    cursor = connection.cursor()
+    query = """
+    INSERT INTO user_locations (user_id, latitude, longitude, timestamp)
+    VALUES (%s, %s, %s, NOW())
+    """
     try:
-        query = """
-        INSERT INTO user_locations (user_id, latitude, longitude, timestamp)
-        VALUES (%s, %s, %s, NOW())
-        """
-        cursor.execute(query, (user_id, latitude, longitude))
-        connection.commit()
+        with pool.cursor(commit=True) as cursor:
+            cursor.execute(query, (user_id, latitude, longitude))
     except mysql.connector.Error as err:
         logger.error(f"Error: {err}")
-    finally:
-        cursor.close()
-        connection.close()
 
 def get_latest_position(user_id, time_limit_minutes):
-    connection = pool.get_connection()
-    cursor = connection.cursor(dictionary=True)
+    time_limit = datetime.datetime.now() - datetime.timedelta(minutes=time_limit_minutes)
+    query = """
+    SELECT latitude, longitude, timestamp
+    FROM user_locations
+    WHERE user_id = %s AND timestamp >= %s
+    ORDER BY timestamp DESC
+    LIMIT 1
+    """
     try:
-        time_limit = datetime.datetime.now() - datetime.timedelta(minutes=time_limit_minutes)
-        
-        query = """
-        SELECT latitude, longitude, timestamp
-        FROM user_locations
-        WHERE user_id = %s AND timestamp >= %s
-        ORDER BY timestamp DESC
-        LIMIT 1
-        """
-        cursor.execute(query, (user_id, time_limit))
-        result = cursor.fetchone()
-        
-        if result:
-            return {
-                'latitude': result['latitude'],
-                'longitude': result['longitude'],
-                'timestamp': result['timestamp']
-            }
-        else:
-            return None 
-
+        with pool.cursor(dictionary=True) as cursor:
+            cursor.execute(query, (user_id, time_limit))
+            result = cursor.fetchone()
     except mysql.connector.Error as err:
         logger.error(f"Error: {err}")
         return None
-    finally:
-        cursor.close()
-        connection.close()
+
+    if result:
+        return {
+            'latitude': result['latitude'],
+            'longitude': result['longitude'],
+            'timestamp': result['timestamp']
+        }
+    else:
+        return None
 
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
 
-bot = TeleBot(BOT_TOKEN)
+next_steps = SessionStepBackend(sessions)
+bot = TeleBot(BOT_TOKEN, next_step_backend=next_steps)
+instrument_bot_api()
 logger.info("Bot is started")
 
 start_keyboard_list_non_auth = ["🔍Пошук закладів", "⚙️Налаштування"]
@@ -510,7 +265,7 @@ start_keyboard_auth = types.ReplyKeyboardMarkup(one_time_keyboard=True, resize_k
 for button in start_keyboard_list_auth:
     start_keyboard_auth.add(types.KeyboardButton(text=button))
 
-settings_keyboard_button_list = ["📏Змінити радіус пошуку"]
+settings_keyboard_button_list = ["📏Змінити радіус пошуку", "🕒Лише відкриті заклади"]
 settings_keyboard = types.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
 for button in settings_keyboard_button_list:
     settings_keyboard.add(types.KeyboardButton(text=button))
@@ -521,6 +276,9 @@ for button in location_keyboard_buttons_list:
     location_keyboard.add(types.KeyboardButton(text=button))
 
 ranges_list = ["250", "500", "1000", "1500", "2000", "3000", "4000", "5000"]
+search_cache = SearchCache(redis_client, ranges_list,
+                           cell_meters=int(os.environ.get("SEARCH_CACHE_CELL_METERS", 250)),
+                           ttl_seconds=int(os.environ.get("SEARCH_CACHE_TTL", os.environ.get("SPATIAL_INDEX_REFRESH_SECONDS", 3600))))
 set_range_keyboard = types.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
 ranges_chunks = [ranges_list[i:i+2] for i in range(0, len(ranges_list), 2)]
 for chunk in ranges_chunks[:-1]:
@@ -547,10 +305,10 @@ class States:
     SEARCHING = "SEARCHING"
 
 def set_user_state(user_id, state):
-    redis_client.set(f"state_{user_id}", state)
+    sessions.set(user_id, "state", state)
 
 def get_user_state(user_id):
-    state_bytes = redis_client.get(f"state_{user_id}")
+    state_bytes = sessions.get(user_id, "state")
     if state_bytes is not None:
         return state_bytes.decode('utf-8')
     return None
@@ -607,23 +365,16 @@ def back_handler(message):
         bot.send_message(chat_id, "Неможливо повернутись назад, повертаю в головне меню", reply_markup=start_keyboard_auth)
         
 def check_if_user_auth(user_id):
-    connection = pool.get_connection()
-    try:
-        if connection.is_connected():
-            query = f"SELECT * FROM Users WHERE tg_user_id = {user_id}"
-            cursor = connection.cursor()
-            cursor.execute(query)
-            result = cursor.fetchall()
-            cursor.close()
-    finally:
-        connection.close()
-    return result != None
+    with pool.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM Users WHERE tg_user_id = %s", (user_id,))
+        result = cursor.fetchone()
+    return result is not None
 
 @bot.message_handler(commands=['start'])
 def start(message):
     user_id = message.from_user.id
-    redis_client.delete(message.chat.id)
-    redis_client.set(str(message.chat.id) + "_range", 300)
+    sessions.delete(message.chat.id, "location")
+    sessions.set(message.chat.id, "range", 300)
 
     if check_if_user_auth(user_id):
         bot.send_message(message.chat.id,
@@ -644,31 +395,11 @@ def handle_contact(message):
     phone_number = message.contact.phone_number
     user_id = message.from_user.id
 
-    connection = pool.get_connection()
-    try:
-        if connection.is_connected():
-            cursor = connection.cursor()
-            cursor.execute("SELECT * FROM Users WHERE tg_user_id = %s", (user_id,))
-            existing_user = cursor.fetchone()
-            connection.commit()
-            cursor.close()
-    finally:
-        connection.close()
-
-    if existing_user:
-        pass
-    else:
-        connection = pool.get_connection()
-        try:
-            if connection.is_connected():
-                sql = """INSERT INTO Users (tg_user_id, phone_number) VALUES (%s, %s)"""
-                values = (user_id, phone_number)
-                cursor = connection.cursor()
-                cursor.execute(sql, values)
-                connection.commit()
-                cursor.close()
-        finally:
-            connection.close()
+    with pool.cursor(commit=True) as cursor:
+        cursor.execute("SELECT 1 FROM Users WHERE tg_user_id = %s", (user_id,))
+        if cursor.fetchone() is None:
+            sql = """INSERT INTO Users (tg_user_id, phone_number) VALUES (%s, %s)"""
+            cursor.execute(sql, (user_id, phone_number))
 
     bot.send_message(message.chat.id, "✅Авторизація успішна!")
     bot.send_message(message.chat.id,
@@ -681,21 +412,15 @@ def save_location(message):
     if message.text == "/back":
         back_handler(message)
     location_string = f"{message.location.latitude},{message.location.longitude}"
-    redis_client.set(message.chat.id, location_string)
+    sessions.set(message.chat.id, "location", location_string)
     store_user_location(message.from_user.id, message.location.latitude, message.location.longitude)
     bot.send_message(message.chat.id, "📝Запам'ятав", reply_markup=location_keyboard)
 
+@timed_handler("show_favourites")
 def show_favourites(user_id, chat_id):
-    connection = pool.get_connection()
-    try:
-        if connection.is_connected():
-            query = f"SELECT place_id FROM Favourites WHERE tg_user_id = {user_id}"
-            cursor = connection.cursor()
-            cursor.execute(query)
-            place_ids = cursor.fetchall()
-            cursor.close()
-    finally:
-        connection.close()
+    with pool.cursor() as cursor:
+        cursor.execute("SELECT place_id FROM Favourites WHERE tg_user_id = %s", (user_id,))
+        place_ids = cursor.fetchall()
     places = []
     for place in place_ids:
         places.append({"place_id": place[0]})
@@ -703,13 +428,15 @@ def show_favourites(user_id, chat_id):
         bot.send_message(chat_id, "🔍За вашим запитом нічого не знайдено.", reply_markup=start_keyboard_auth)
         logger.debug("No places found for the search query.")
         return
-    redis_client.delete(f'{chat_id}_places')
-    for dictionary in places:
-        redis_client.rpush(f'{chat_id}_places', json.dumps(dictionary))
-    first_place = redis_client.lindex(f'{chat_id}_places', 0)
+    sessions.replace_place_refs(chat_id, "places", [(place["place_id"], 0) for place in places])
+    first_place = places[0]
     if first_place:
-        first_place = json.loads(first_place)
-        response_places, map_link, website, photos = get_detailed_place_info_without_distance(first_place["place_id"], user_id)
+        card, response_places = get_place_card(first_place["place_id"], user_id)
+        if card is None:
+            bot.send_message(chat_id, "Сталася помилка. Спробуйте ще раз", reply_markup=start_keyboard_auth)
+            return
+        map_link = generate_map_link(card.place_id)
+        website = card.website
         keyboard_places = types.InlineKeyboardMarkup(row_width=2)
         if map_link:
             keyboard_places.add(types.InlineKeyboardButton(text="🗺️Відобразити на мапі", url=map_link))
@@ -727,11 +454,11 @@ def show_favourites(user_id, chat_id):
         keyboard_places.add(
             types.InlineKeyboardButton("➡️", callback_data=f"placefavourites_{1}"),
         )
-        redis_client.delete(f"{chat_id}_places_message")
         sent_message_places = bot.send_message(chat_id, response_places, reply_markup=keyboard_places)
-        redis_client.set(f"{chat_id}_places_message", sent_message_places.message_id)
+        sessions.set(chat_id, "places_message", sent_message_places.message_id)
 
 @bot.message_handler(content_types=['text'])
+@timed_handler("handle_commands")
 def handle_commands(message):
     if message.text == "⚙️Налаштування":
         set_user_state(message.from_user.id, States.SETTINGS)
@@ -748,25 +475,17 @@ def handle_commands(message):
     elif message.text == "📝Редагувати відгуки":
         set_user_state(message.from_user.id, States.EDIT_REVIEWS)
         user_id = message.from_user.id
-        connection = pool.get_connection()
-        try:
-            if connection.is_connected():
-                query = f"SELECT id, place_id, name, score, review, date FROM UsersReviews WHERE tg_user_id = {user_id}"
-                cursor = connection.cursor()
-                cursor.execute(query)
-                user_reviews = cursor.fetchall()
-                cursor.close()
-        finally:
-            connection.close()
+        with pool.cursor() as cursor:
+            query = "SELECT id, place_id, name, score, review, date FROM UsersReviews WHERE tg_user_id = %s"
+            cursor.execute(query, (user_id,))
+            user_reviews = cursor.fetchall()
 
         user_reviews_list = []
         for review in user_reviews:
             user_reviews_list.append({"id": review[0], "place_id": review[1], "name": review[2], "score": review[3], "review": review[4], "date": review[5].strftime('%Y-%m-%d %H:%M:%S')})
 
-        redis_client.delete(f'{message.chat.id}_reviews_edit')
+        sessions.replace_list(message.chat.id, "reviews_edit", user_reviews_list)
         if len(user_reviews_list) != 0:
-            for dictionary in user_reviews_list:
-                redis_client.rpush(f'{message.chat.id}_reviews_edit', json.dumps(dictionary))
 
             inline_keyboard = types.InlineKeyboardMarkup(row_width=2)
             if len(user_reviews_list) > 1:
@@ -778,17 +497,25 @@ def handle_commands(message):
                 )
             response_first_review = get_review_response(user_reviews_list[0]["name"], user_reviews_list[0]["score"], user_reviews_list[0]["date"], user_reviews_list[0]["review"])
             sent_message_reviews = bot.send_message(message.chat.id, response_first_review, reply_markup=inline_keyboard)
-            redis_client.set(f"{message.chat.id}_message_reviews_edit", sent_message_reviews.message_id)
+            sessions.set(message.chat.id, "reviews_edit_message", sent_message_reviews.message_id)
         else:
             set_user_state(message.from_user.id, States.MAIN_MENU)
             bot.send_message(message.chat.id, "Ви ще не залишали відгуків", reply_markup=start_keyboard_auth)
     elif message.text == "📏Змінити радіус пошуку":
         set_user_state(message.from_user.id, States.CHANGE_SEARCH_RADIUS)
         bot.send_message(message.chat.id, "📏Оберіть бажаний радіус пошуку", reply_markup=set_range_keyboard)
+    elif message.text == "🕒Лише відкриті заклади":
+        open_only = not sessions.exists(message.chat.id, "open_only")
+        if open_only:
+            sessions.set(message.chat.id, "open_only", 1)
+            bot.send_message(message.chat.id, "✅Показуватиму лише відкриті зараз заклади", reply_markup=start_keyboard_auth)
+        else:
+            sessions.delete(message.chat.id, "open_only")
+            bot.send_message(message.chat.id, "✅Показуватиму всі заклади", reply_markup=start_keyboard_auth)
     elif message.text in ranges_list:
         bot.send_message(message.chat.id, "✅Обрано", reply_markup=start_keyboard_auth)
         try:
-            redis_client.set(str(message.chat.id) + "_range", int(message.text))
+            sessions.set(message.chat.id, "range", int(message.text))
         except ValueError:
             set_user_state(message.from_user.id, States.MAIN_MENU)
             bot.send_message(message.chat.id, "❗️Виникла помилка, спробуйте ще раз", reply_markup=start_keyboard_auth)
@@ -796,6 +523,8 @@ def handle_commands(message):
         set_user_state(message.from_user.id, States.MAIN_MENU)
         bot.send_message(message.chat.id, "🚫Такої команди не існує, почніть заново", reply_markup=start_keyboard_auth)
 
+@next_steps.step
+@timed_handler("handle_keywords_for_search")
 def handle_keywords_for_search(message):
     if message.text == "/back":
         back_handler(message)
@@ -808,18 +537,22 @@ def handle_keywords_for_search(message):
             search(message, type="bar")
 
 def show_next_or_prev_favourite_place(user_id, chat_id, call_id, index):
-    message_id = redis_client.get(f"{chat_id}_places_message")
+    message_id = sessions.get(chat_id, "places_message")
     if message_id is None:
         bot.answer_callback_query(call_id, "Сталася помилка. Спробуйте ще раз")
         return
     message_id = message_id.decode()
-    place_data = redis_client.lindex(f'{chat_id}_places', index)
-    len_places = redis_client.llen(f'{chat_id}_places')
-    if place_data is None:
+    place_ref, len_places = sessions.place_ref(chat_id, "places", index)
+    if place_ref is None:
         bot.answer_callback_query(call_id, "No more results.")
         return
-    place_data = json.loads(place_data)
-    response, map_link, website, place_photos = get_detailed_place_info_without_distance(place_data["place_id"], chat_id)
+    place_data = {"place_id": place_ref[0]}
+    card, response = get_place_card(place_data["place_id"], chat_id)
+    if card is None:
+        bot.answer_callback_query(call_id, "Сталася помилка. Спробуйте ще раз")
+        return
+    map_link = generate_map_link(card.place_id)
+    website = card.website
     inline_keyboard = types.InlineKeyboardMarkup(row_width=2)
     if map_link:
         inline_keyboard.add(types.InlineKeyboardButton(text="🗺️Відобразити на мапі", url=map_link))
@@ -854,9 +587,8 @@ def show_next_or_prev_favourite_place(user_id, chat_id, call_id, index):
         bot.answer_callback_query(call_id, "Сталася помилка. Спробуйте ще раз")
 
 def send_next_review_for_edit(chat_id, call_id, index):
-    message_id = redis_client.get(f"{chat_id}_message_reviews_edit")
-    len_reviews = redis_client.llen(f'{chat_id}_reviews_edit')
-    review_data = json.loads(redis_client.lindex(f'{chat_id}_reviews_edit', index))
+    message_id = sessions.get(chat_id, "reviews_edit_message")
+    review_data, len_reviews = sessions.item(chat_id, "reviews_edit", index)
     inline_keyboard = types.InlineKeyboardMarkup(row_width=2)
     if index > 0 and index < len_reviews - 1:
         inline_keyboard.add(
@@ -882,41 +614,37 @@ def send_next_review_for_edit(chat_id, call_id, index):
         bot.answer_callback_query(call_id, "Сталася помилка. Спробуйте ще раз")
 
 def add_place_to_favourites(call_id, place_id, user_id):
-    query_insert = f"INSERT IGNORE INTO Favourites (place_id, tg_user_id) VALUES ('{place_id}', '{user_id}')"
-    connection = pool.get_connection()
+    query_insert = "INSERT IGNORE INTO Favourites (place_id, tg_user_id) VALUES (%s, %s)"
     try:
-        if connection.is_connected():
-            cursor = connection.cursor()
-            cursor.execute(query_insert)
-            connection.commit()
-            cursor.close()
-            bot.answer_callback_query(call_id, "Заклад успішно додано до обраних")
+        with pool.cursor(commit=True) as cursor:
+            cursor.execute(query_insert, (place_id, user_id))
+        bot.answer_callback_query(call_id, "Заклад успішно додано до обраних")
     except Exception as e:
-        connection.rollback()
         logger.error(f"An error occurred while adding to favourites: {e}")
-    finally:
-        connection.close()
 
 def show_next_place(chat_id, call_id, index, latitude, longitude, user_id):
-    message_id = redis_client.get(f"{chat_id}_places_message")
+    message_id = sessions.get(chat_id, "places_message")
     if message_id is None:
         bot.answer_callback_query(call_id, "Сталася помилка. Спробуйте ще раз")
         return
     message_id = message_id.decode()
-    place_data = redis_client.lindex(f'{chat_id}_places', index)
-    len_places = redis_client.llen(f'{chat_id}_places')
-    if place_data is None:
+    place_ref, len_places = sessions.place_ref(chat_id, "places", index)
+    if place_ref is None:
         bot.answer_callback_query(call_id, "Більше результатів немає")
         return
-    place_data = json.loads(place_data)
-    if redis_client.exists(f"{chat_id}_reviews_message"):
-        message_id_reviews = redis_client.get(f"{chat_id}_reviews_message")
+    place_data = {"place_id": place_ref[0]}
+    message_id_reviews = sessions.pop(chat_id, "reviews_message")
+    if message_id_reviews is not None:
         try:
             bot.delete_message(chat_id=chat_id, message_id=message_id_reviews)
         except Exception as e:
             logger.exception(f"Error while deleting message: {e}")
-        redis_client.delete(f"{chat_id}_reviews_message")
-    response, map_link, website = get_detailed_place_info(place_data["place_id"], latitude, longitude, user_id)
+    card, response = get_place_card(place_data["place_id"], user_id, latitude, longitude)
+    if card is None:
+        bot.answer_callback_query(call_id, "Сталася помилка. Спробуйте ще раз")
+        return
+    map_link = generate_map_link(card.place_id)
+    website = card.website
     inline_keyboard = types.InlineKeyboardMarkup(row_width=2)
     if map_link:
         inline_keyboard.add(types.InlineKeyboardButton(text="🗺️Відобразити на мапі", url=map_link))
@@ -951,17 +679,15 @@ def show_next_place(chat_id, call_id, index, latitude, longitude, user_id):
         bot.answer_callback_query(call_id, "Сталася помилка. Спробуйте ще раз")
 
 def show_next_review(chat_id, call_id, index):
-    message_id = redis_client.get(f"{chat_id}_reviews_message")
+    message_id = sessions.get(chat_id, "reviews_message")
     if message_id is None:
         bot.answer_callback_query(call_id, "Сталася помилка. Спробуйте ще раз")
         return
     message_id = message_id.decode()
-    review_data = redis_client.lindex(f'{chat_id}_reviews', index)
-    len_reviews = redis_client.llen(f'{chat_id}_reviews')
+    review_data, len_reviews = sessions.item(chat_id, "reviews", index)
     if review_data is None:
         bot.answer_callback_query(call_id, "Більше нема :)")
         return
-    review_data = json.loads(review_data)
     if "relative_time_description" in review_data:
         response_reviews = get_review_response(review_data["author_name"], str(review_data["rating"]), review_data["relative_time"], review_data["text"])
     elif "date" in review_data:
@@ -989,8 +715,8 @@ def show_next_review(chat_id, call_id, index):
 def send_place_reviews(call_id, chat_id, place_id):
     reviews = get_place_reviews(place_id)
     chat_id = str(chat_id)
-    redis_client.delete(f'{chat_id}_reviews')
     if reviews is None:
+        sessions.delete_list(chat_id, "reviews")
         bot.answer_callback_query(call_id, "Для цього закладу ще немає відгуків")
         return
     if "date" in reviews[0]:
@@ -1007,12 +733,11 @@ def send_place_reviews(call_id, chat_id, place_id):
                 dictionary["date"] = dictionary["date"]
             if "relative_time" in dictionary:
                 dictionary["relative_time"] = datetime.datetime.strftime(dictionary['relative_time'], '%d.%m.%Y')
-            redis_client.rpush(f'{chat_id}_reviews', json.dumps(dictionary))
     else:
         keyboard_reviews = None
-    redis_client.delete(f"{chat_id}_reviews_message")
+    sessions.replace_list(chat_id, "reviews", reviews)
     sent_message_reviews = bot.send_message(chat_id, response_reviews, reply_markup=keyboard_reviews)
-    redis_client.set(f"{chat_id}_reviews_message", sent_message_reviews.message_id)
+    sessions.set(chat_id, "reviews_message", sent_message_reviews.message_id)
 
 def get_review_response(name, score, date_or_str, review):
     if isinstance(date_or_str, datetime.date):
@@ -1035,22 +760,21 @@ def edit_review(message, chat_id, review_id):
     bot.send_message(chat_id, "👤Введіть ваше ім'я:")
     bot.register_next_step_handler(message, handle_name, review_id=review_id)
 
+@timed_handler("show_next_page")
 def show_next_page(page_size, index, chat_id, latitude, longitude):
     page_size = 5
-    places_length = redis_client.llen(f"{chat_id}_places")
     index = int(index)
     start_index =  index * page_size
     end_index = start_index + page_size
+    place_refs, places_length = sessions.place_refs_page(chat_id, "places", start_index, end_index)
     if end_index >= places_length:
         end_index = places_length - 1
-    places = redis_client.lrange(f"{chat_id}_places", start_index, end_index - 1)
-    places = [json.loads(place) for place in places]
-    names = [elem["name"] for elem in places]
+    places = resolve_place_refs(place_refs[:max(end_index - start_index, 0)])
     response = "☕️ Топ заклади поруч з вами\n"
-    for i in range(start_index, end_index):
-        response += f"{i+1}. {names[i - start_index]}\n"
-        distance = int(places[i - start_index]["distance"])
-        formatted_address = extract_address(places[i - start_index]["formatted_address"])
+    for i, place in enumerate(places, start=start_index):
+        response += f"{i+1}. {place['name']}\n"
+        distance = int(place["distance"])
+        formatted_address = extract_address(place["formatted_address"])
         response += f"🧭 {distance}м\n"
         response += f"📍 {formatted_address}\n"
     keyboard_places = types.InlineKeyboardMarkup()
@@ -1064,24 +788,23 @@ def show_next_page(page_size, index, chat_id, latitude, longitude):
     for i in range(len(places)):
         number_buttons.append(types.InlineKeyboardButton(f"{number_to_emoji(i+start_index+1)}", callback_data=f"sendplace_{latitude}_{longitude}_{places[i]['place_id']}"))
     keyboard_places.row(*number_buttons)
-    message_id = redis_client.get(f"sentmessageplaces_{chat_id}")
+    message_id = sessions.get(chat_id, "places_list_message")
     bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=response, reply_markup=keyboard_places)
 
+@timed_handler("show_prev_page")
 def show_prev_page(page_size, index, chat_id, latitude, longitude):
-    places_length = redis_client.llen(f"{chat_id}_places")
     index = int(index)
     start_index =  index * page_size
     end_index = start_index + page_size
+    place_refs, places_length = sessions.place_refs_page(chat_id, "places", start_index, end_index)
     if end_index >= places_length:
         end_index = places_length - 1
-    places = redis_client.lrange(f"{chat_id}_places", start_index, end_index - 1)
-    places = [json.loads(place) for place in places]
-    names = [elem["name"] for elem in places]
+    places = resolve_place_refs(place_refs[:max(end_index - start_index, 0)])
     response = "☕️ Топ заклади поруч з вами\n"
-    for i in range(start_index, end_index):
-        response += f"{i+1}. {names[i - start_index]}\n"
-        distance = int(places[i - start_index]["distance"])
-        formatted_address = extract_address(places[i - start_index]["formatted_address"])
+    for i, place in enumerate(places, start=start_index):
+        response += f"{i+1}. {place['name']}\n"
+        distance = int(place["distance"])
+        formatted_address = extract_address(place["formatted_address"])
         response += f"🧭 {distance}м\n"
         response += f"📍 {formatted_address}\n"
     keyboard_places = types.InlineKeyboardMarkup()
@@ -1095,34 +818,50 @@ def show_prev_page(page_size, index, chat_id, latitude, longitude):
     for i in range(len(places)):
         number_buttons.append(types.InlineKeyboardButton(f"{number_to_emoji(i+start_index+1)}", callback_data=f"sendplace_{latitude}_{longitude}_{places[i]['place_id']}"))
     keyboard_places.row(*number_buttons)
-    message_id = redis_client.get(f"sentmessageplaces_{chat_id}")
+    message_id = sessions.get(chat_id, "places_list_message")
     bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=response, reply_markup=keyboard_places)
 
 def remove_from_favourites(place_id, user_id):
-    query = f"DELETE FROM Favourites WHERE place_id='{place_id}' AND tg_user_id={user_id}"
-    connection = pool.get_connection()
+    query = "DELETE FROM Favourites WHERE place_id = %s AND tg_user_id = %s"
     try:
-        if connection.is_connected():
-            cursor = connection.cursor()
-            cursor.execute(query)
-            connection.commit()
-            cursor.close()
+        with pool.cursor(commit=True) as cursor:
+            cursor.execute(query, (place_id, user_id))
     except Exception as e:
-        connection.rollback()
-        logger.error(f"An error occurred while adding to favourites: {e}")
-    finally:
-        connection.close()
+        logger.error(f"An error occurred while removing from favourites: {e}")
+
+def send_place_photos(chat_id, photos):
+    if not photos:
+        return []
+    media = [types.InputMediaPhoto(photo.telegram_file_id or photo_store.read(photo.checksum)) for photo in photos]
+    try:
+        media_messages = bot.send_media_group(chat_id, media)
+    except ApiTelegramException as e:
+        if not any(photo.telegram_file_id for photo in photos):
+            raise
+        logger.warning(f"Cached photo file ids rejected, re-uploading: {e}")
+        for photo in photos:
+            photo.telegram_file_id = None
+        media = [types.InputMediaPhoto(photo_store.read(photo.checksum)) for photo in photos]
+        media_messages = bot.send_media_group(chat_id, media)
+
+    new_file_ids = []
+    for photo, message in zip(photos, media_messages):
+        if photo.telegram_file_id is None and message.photo:
+            new_file_ids.append((message.photo[-1].file_id, photo.id))
+    if new_file_ids:
+        update_photo_file_ids(pool, new_file_ids)
+    return [message.message_id for message in media_messages]
 
+@timed_handler("send_place_info")
 def send_place_info(chat_id, user_id, place_id, latitude, longitude):
-    sent_message_id = redis_client.get(f"place_message_id_{chat_id}")
-    photos_message_ids = redis_client.lrange(f"place_photos_id_{chat_id}", 0, -1)
+    sent_message_id = sessions.get(chat_id, "place_message")
+    photos_message_ids = sessions.pop_list(chat_id, "place_photos")
     if photos_message_ids:
         for message_id in photos_message_ids:
             try:
                 bot.delete_message(chat_id=chat_id, message_id=message_id)
             except:
                 pass
-        redis_client.delete(f"place_photos_id_{chat_id}")
     
     if sent_message_id: 
         try:
@@ -1130,15 +869,18 @@ def send_place_info(chat_id, user_id, place_id, latitude, longitude):
         except:
             pass
     
-    place_is_favourite = is_favourite(place_id, chat_id)
-    
-    response, map_link, website, photos = get_detailed_place_info(place_id, latitude, longitude, chat_id)
+    card, response = get_place_card(place_id, chat_id, latitude, longitude)
+    if card is None:
+        bot.send_message(chat_id, "Сталася помилка. Спробуйте ще раз")
+        return
+    map_link = generate_map_link(place_id)
+    website = card.website
     inline_keyboard = types.InlineKeyboardMarkup(row_width=2)
     if map_link:
         inline_keyboard.add(types.InlineKeyboardButton(text="🗺️Відобразити на мапі", url=map_link))
     if website is not None:
         inline_keyboard.add(types.InlineKeyboardButton(text="🌐Вебсайт", url=website))
-    if place_is_favourite:
+    if card.is_favourite:
         inline_keyboard.add(
                 types.InlineKeyboardButton("❌Прибрати з обраних", callback_data=f"removefromfavourites_{user_id}_{place_id}"),
         )
@@ -1152,98 +894,94 @@ def send_place_info(chat_id, user_id, place_id, latitude, longitude):
     inline_keyboard.add(
         types.InlineKeyboardButton("➕Додати відгук", callback_data=f"addreview_{place_id}"),
     )
-    media = []
-    for index, photo in enumerate(photos):
-        media.append(types.InputMediaPhoto(photo))
-    
-    if media:
-        media_messages = bot.send_media_group(chat_id, media)
-        photo_message_ids = [msg.message_id for msg in media_messages]
-    else:
-        photo_message_ids = []
-    
-    for message_id in photo_message_ids:
-        redis_client.rpush(f"place_photos_id_{chat_id}", message_id)
+    photo_message_ids = send_place_photos(chat_id, card.photos)
+
+    sessions.append(chat_id, "place_photos", photo_message_ids)
         
     place_message_id = bot.send_message(chat_id, response, reply_markup=inline_keyboard).message_id
-    redis_client.set(f"place_message_id_{chat_id}", place_message_id)
+    sessions.set(chat_id, "place_message", place_message_id)
+
+navigation_branches = {"place", "review", "favourites", "placefavourites", "sendreviews", "addreview", "reviewedit",
+                       "editreview", "removefromfavourites", "nextpage", "prevpage", "sendplace"}
 
 @bot.callback_query_handler(func=lambda call: True)
 def handle_navigation(call):
     data = call.data.split("_")
-    try:
-        if data[0] == "place":
-            prefix, index, latitude, longitude, type = data
-            index = int(index)
-            show_next_place(chat_id, call.id, index, latitude, longitude, user_id)
-        elif data[0] == "review":
-            prefix, index = data
-            index = int(index)
-            chat_id = call.message.chat.id
-            place_id = '_'.join(data[1:])
-            show_next_review(chat_id, call.id, index)
-        elif data[0] == "favourites":
-            prefix = data[0]
-            place_id = '_'.join(data[1:])
-            user_id = data[1]
-            add_place_to_favourites(call.id, place_id, user_id)
-        elif data[0] == "placefavourites":
-            prefix, index = data
-            index = int(index)
-            chat_id = call.message.chat.id
-            show_next_or_prev_favourite_place(user_id, chat_id, call.id, index)
-        elif data[0] == "sendreviews":
-            prefix = data[0]
-            place_id = '_'.join(data[1:])
-            chat_id = call.message.chat.id
-            send_place_reviews(call.id, chat_id, place_id)
-        elif data[0] == "addreview":
-            prefix = data[0]
-            place_id = '_'.join(data[1:])
-            chat_id = call.message.chat.id
-            add_review(call.message, chat_id, place_id)
-        elif data[0] == "reviewedit":
-            prefix, index = data
-            index = int(index)
-            send_next_review_for_edit(chat_id, call.id, index)
-        elif data[0] == "editreview":
-            prefix, review_id = data
-            edit_review(call.message, chat_id, review_id)
-        elif data[0] == "removefromfavourites":
-            prefix = data[0]
-            user_id = data[1]
-            place_id = '_'.join(data[2:])
-            remove_from_favourites(place_id, user_id)
-            bot.answer_callback_query(call.id, "Заклад успішно прибрано з обраних")
-        elif data[0] == "nextpage":
-            prefix = data[0]
-            index = data[1]
-            user_id = data[2]
-            latitude = data[3]
-            longitude = data[4]
-            chat_id = call.message.chat.id
-            show_next_page(5, index, chat_id, latitude, longitude)
-        elif data[0] == "prevpage":
-            prefix = data[0]
-            index = data[1]
-            user_id = data[2]
-            latitude = data[3]
-            longitude = data[4]
-            chat_id = call.message.chat.id
-            show_prev_page(5, index, chat_id, latitude, longitude)
-        elif data[0] == "sendplace":
-            prefix = data[0]
-            latitude = data[1]
-            longitude = data[2]
-            place_id = '_'.join(data[3:])
-            chat_id = call.message.chat.id
-            user_id = call.message.from_user.id
-            send_place_info(chat_id, user_id, place_id, latitude, longitude)  
+    with handler_timer(f"handle_navigation:{data[0] if data[0] in navigation_branches else 'unknown'}"):
+        try:
+            if data[0] == "place":
+                prefix, index, latitude, longitude, type = data
+                index = int(index)
+                show_next_place(chat_id, call.id, index, latitude, longitude, user_id)
+            elif data[0] == "review":
+                prefix, index = data
+                index = int(index)
+                chat_id = call.message.chat.id
+                place_id = '_'.join(data[1:])
+                show_next_review(chat_id, call.id, index)
+            elif data[0] == "favourites":
+                prefix = data[0]
+                place_id = '_'.join(data[1:])
+                user_id = data[1]
+                add_place_to_favourites(call.id, place_id, user_id)
+            elif data[0] == "placefavourites":
+                prefix, index = data
+                index = int(index)
+                chat_id = call.message.chat.id
+                show_next_or_prev_favourite_place(user_id, chat_id, call.id, index)
+            elif data[0] == "sendreviews":
+                prefix = data[0]
+                place_id = '_'.join(data[1:])
+                chat_id = call.message.chat.id
+                send_place_reviews(call.id, chat_id, place_id)
+            elif data[0] == "addreview":
+                prefix = data[0]
+                place_id = '_'.join(data[1:])
+                chat_id = call.message.chat.id
+                add_review(call.message, chat_id, place_id)
+            elif data[0] == "reviewedit":
+                prefix, index = data
+                index = int(index)
+                send_next_review_for_edit(chat_id, call.id, index)
+            elif data[0] == "editreview":
+                prefix, review_id = data
+                edit_review(call.message, chat_id, review_id)
+            elif data[0] == "removefromfavourites":
+                prefix = data[0]
+                user_id = data[1]
+                place_id = '_'.join(data[2:])
+                remove_from_favourites(place_id, user_id)
+                bot.answer_callback_query(call.id, "Заклад успішно прибрано з обраних")
+            elif data[0] == "nextpage":
+                prefix = data[0]
+                index = data[1]
+                user_id = data[2]
+                latitude = data[3]
+                longitude = data[4]
+                chat_id = call.message.chat.id
+                show_next_page(5, index, chat_id, latitude, longitude)
+            elif data[0] == "prevpage":
+                prefix = data[0]
+                index = data[1]
+                user_id = data[2]
+                latitude = data[3]
+                longitude = data[4]
+                chat_id = call.message.chat.id
+                show_prev_page(5, index, chat_id, latitude, longitude)
+            elif data[0] == "sendplace":
+                prefix = data[0]
+                latitude = data[1]
+                longitude = data[2]
+                place_id = '_'.join(data[3:])
+                chat_id = call.message.chat.id
+                user_id = call.message.from_user.id
+                send_place_info(chat_id, user_id, place_id, latitude, longitude)  
             
-    except Exception as e:
-        logger.error(f"Error editing message: {e}")
-        bot.answer_callback_query(call.id, "Сталася помилка. Спробуйте ще раз")
+        except Exception as e:
+            logger.error(f"Error editing message: {e}")
+            bot.answer_callback_query(call.id, "Сталася помилка. Спробуйте ще раз")
 
+@next_steps.step
 def handle_name(message, place_id=None, review_id=None):
     if message.text == "/back":
         back_handler(message)
@@ -1254,13 +992,14 @@ def handle_name(message, place_id=None, review_id=None):
                     reply_markup=start_keyboard_auth)
         return
     if message.text:
-        redis_client.set(f"review_{place_id}_name_{message.chat.id}", message.text)
+        sessions.set(message.chat.id, f"review:{place_id}:name", message.text)
         bot.send_message(message.chat.id, "⭐Введіть оцінку від 1 до 5:")
         bot.register_next_step_handler(message, handle_score, place_id=place_id, review_id=review_id)
     else:
         bot.send_message(message.chat.id, "⚠️Ви надіслали порожнє повідомлення, введіть ім'я:")
         bot.register_next_step_handler(message, handle_name, place_id=place_id, review_id=review_id)
 
+@next_steps.step
 def handle_score(message, place_id=None, review_id=None):
     if message.text == "/back":
         back_handler(message)
@@ -1282,13 +1021,14 @@ def handle_score(message, place_id=None, review_id=None):
             bot.send_message(message.chat.id, "⚠️Треба ввести оцінку від 1 до 5:")
             bot.register_next_step_handler(message, handle_score, place_id=place_id, review_id=review_id)
             return
-        redis_client.set(f"review_{place_id}_score_{message.chat.id}", message.text)
+        sessions.set(message.chat.id, f"review:{place_id}:score", message.text)
         bot.send_message(message.chat.id, "📝Введіть відгук:")
         bot.register_next_step_handler(message, handle_review, place_id=place_id, review_id=review_id)
     else:
         bot.send_message(message.chat.id, "⚠️Ви надіслали порожнє повідомлення, введіть оцінку:")
         bot.register_next_step_handler(message, handle_score, place_id=place_id, review_id=review_id)
 
+@next_steps.step
 def handle_review(message, place_id=None, review_id=None):
     if message.text == "/back":
         back_handler(message)
@@ -1299,38 +1039,27 @@ def handle_review(message, place_id=None, review_id=None):
                     reply_markup=start_keyboard_auth)
         return
     if message.text:
-        name = redis_client.get(f"review_{place_id}_name_{message.chat.id}")
+        name = sessions.get(message.chat.id, f"review:{place_id}:name")
         name = name.decode('utf-8')
-        score = int(redis_client.get(f"review_{place_id}_score_{message.chat.id}"))
+        score = int(sessions.get(message.chat.id, f"review:{place_id}:score"))
         review = message.text
         date = datetime.datetime.now()
-        connection = pool.get_connection()
         if place_id:
-            query = f"INSERT INTO UsersReviews (place_id, name, tg_user_id, score, review, date) VALUES ('{place_id}', '{name}', {message.from_user.id}, {score}, '{review}', '{date.strftime('%Y-%m-%d %H:%M:%S')}')"
-            try:
-                if connection.is_connected():
-                    cursor = connection.cursor()
-                    cursor.execute(query)
-                    connection.commit()
-                    cursor.close()
-                    bot.send_message(message.chat.id, "✅Ваш відгук успішно додано!")
-            finally:
-                connection.close()
+            query = "INSERT INTO UsersReviews (place_id, name, tg_user_id, score, review, date) VALUES (%s, %s, %s, %s, %s, %s)"
+            with pool.cursor(commit=True) as cursor:
+                cursor.execute(query, (place_id, name, message.from_user.id, score, review, date))
+            bot.send_message(message.chat.id, "✅Ваш відгук успішно додано!")
         elif review_id:
-            query = f"UPDATE UsersReviews SET name='{name}', tg_user_id={message.from_user.id}, score={score}, review='{review}', date='{date.strftime('%Y-%m-%d %H:%M:%S')}' WHERE id={review_id}"
-            try:
-                if connection.is_connected():
-                    cursor = connection.cursor()
-                    cursor.execute(query)
-                    connection.commit()
-                    cursor.close()
-                    bot.send_message(message.chat.id, "✅Ваш відгук успішно відредаговано!")
-            finally:
-                connection.close()
+            query = "UPDATE UsersReviews SET name = %s, tg_user_id = %s, score = %s, review = %s, date = %s WHERE id = %s"
+            with pool.cursor(commit=True) as cursor:
+                cursor.execute(query, (name, message.from_user.id, score, review, date, review_id))
+            bot.send_message(message.chat.id, "✅Ваш відгук успішно відредаговано!")
     else:
         bot.send_message(message.chat.id, "⚠️Ви надіслали порожнє повідомлення, введіть відгук:")
         bot.register_next_step_handler(message, handle_review)
 
+@next_steps.step
+@timed_handler("search")
 def search(message, keywords=None, type=None):
     if message.text == "/back":
         back_handler(message)
@@ -1343,34 +1072,28 @@ def search(message, keywords=None, type=None):
     set_user_state(user_id, States.SEARCHING)
     
     chat_id = message.chat.id
-    if redis_client.exists(f"{chat_id}_reviews_message"):
-        message_id_reviews = redis_client.get(f"{chat_id}_reviews_message")
-
+    message_id_reviews = sessions.pop(chat_id, "reviews_message")
+    if message_id_reviews is not None:
         try:
             bot.delete_message(chat_id=message.chat.id, message_id=message_id_reviews)
         except Exception as e:
             logger.exception(f"Error while deleting message: {e}")
 
-        redis_client.delete(f"{chat_id}_reviews_message")
-
-    if redis_client.exists(f"{chat_id}_places_message"):
-        message_id_places = redis_client.get(f"{chat_id}_places_message")
-
+    message_id_places = sessions.pop(chat_id, "places_message")
+    if message_id_places is not None:
         try:
             bot.delete_message(chat_id=message.chat.id, message_id=message_id_places)
         except Exception as e:
             logger.exception(f"Error while deleting message: {e}")
 
-        redis_client.delete(f"{chat_id}_places_message")
-
     location = get_latest_position(user_id, 5)
     if location:
         latitude, longitude = location["latitude"], location["longitude"]
     if location and latitude and longitude:
-        search_radius = redis_client.get(str(chat_id) + "_range")
+        search_radius = sessions.get(chat_id, "range")
         if(search_radius is None):
             search_radius = 300
-            redis_client.set(str(chat_id) + "_range", search_radius)
+            sessions.set(chat_id, "range", search_radius)
         else:
             search_radius = int(search_radius)
 
@@ -1383,16 +1106,15 @@ def search(message, keywords=None, type=None):
             logger.info(f"Search keywords: {keywords}")
 
             logger.info(f"Search location: ({latitude}, {longitude}). Radius: {search_radius}")
-            places = get_places(float(latitude), float(longitude), search_radius, keywords, type=type)
+            open_only = sessions.exists(chat_id, "open_only")
+            places = get_places(float(latitude), float(longitude), search_radius, keywords, type=type, open_only=open_only)
 
             if not places:
                 bot.send_message(message.chat.id, "🙄За вашим запитом нічого не знайдено.", reply_markup=start_keyboard_auth)
                 logger.debug("No places found for the search query.")
                 return
 
-            redis_client.delete(f'{message.chat.id}_places')
-            for dictionary in places:
-                redis_client.rpush(f'{message.chat.id}_places', json.dumps(dictionary))
+            sessions.replace_place_refs(message.chat.id, "places", [(place["place_id"], place["distance"]) for place in places])
 
             first_five = places[:5]
             names = [elem["name"] for elem in first_five]
@@ -1411,7 +1133,7 @@ def search(message, keywords=None, type=None):
                 number_buttons.append(types.InlineKeyboardButton(f"{number_to_emoji(i+1)}", callback_data=f"sendplace_{latitude}_{longitude}_{first_five[i]['place_id']}"))
             keyboard_places.row(*number_buttons)
             sent_message_places = bot.send_message(message.chat.id, response, reply_markup=keyboard_places, parse_mode="")
-            redis_client.set(f"sentmessageplaces_{message.chat.id}", sent_message_places.message_id)
+            sessions.set(message.chat.id, "places_list_message", sent_message_places.message_id)
         except Exception as e:
             bot.send_message(message.chat.id, "Виникла помилка, почніть заново", reply_markup=start_keyboard_auth)
             logger.error(f"Error : {e}")
@@ -1422,10 +1144,58 @@ def search(message, keywords=None, type=None):
         reply_markup=types.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True, selective=True).add(types.KeyboardButton(text="Надіслати розташування", request_location=True)))
         bot.register_next_step_handler(message, search, keywords, type)
 
-if __name__ == '__main__':
+def run_runtime(runtime):
     while True:
         try:
-            bot.polling()
+            asyncio.run(runtime.run())
+        except KeyboardInterrupt:
+            break
         except Exception as e:
             logger.critical(f"Bot crashed: {e}")
             time.sleep(2)
+
+def run_stream_worker(shards, consumer, handler_workers, max_pending, metrics_port):
+    start_metrics_server(os.environ.get("METRICS_HOST", "127.0.0.1"), metrics_port)
+    threading.Thread(target=listen_for_place_updates, name="place-updates", daemon=True).start()
+    run_runtime(StreamWorker(bot, redis_client, shards, consumer=consumer, max_workers=handler_workers, max_pending=max_pending))
+
+if __name__ == '__main__':
+    bot_mode = os.environ.get("BOT_MODE", "polling")
+    handler_workers = int(os.environ.get("HANDLER_WORKERS", pool_size))
+    max_pending = int(os.environ.get("MAX_PENDING_UPDATES", 10000))
+    update_shards = int(os.environ.get("UPDATE_SHARDS", 1))
+    metrics_port = int(os.environ.get("METRICS_PORT", 9108))
+    if bot_mode == "worker":
+        worker_shards = os.environ.get("WORKER_SHARDS")
+        shards = [int(shard) for shard in worker_shards.split(",")] if worker_shards else list(range(update_shards))
+        worker_name = os.environ.get("WORKER_NAME", socket.gethostname())
+        worker_processes = int(os.environ.get("WORKER_PROCESSES", 1))
+        if worker_processes > len(shards):
+            raise SystemExit(f"WORKER_PROCESSES={worker_processes} exceeds the {len(shards)} shards to consume; "
+                             f"raise UPDATE_SHARDS or list more WORKER_SHARDS")
+        if worker_processes <= 1:
+            run_stream_worker(shards, worker_name, handler_workers, max_pending, metrics_port)
+        else:
+            context = multiprocessing.get_context("spawn")
+            processes = [context.Process(target=run_stream_worker, name=f"worker-{index}",
+                                         args=(shards[index::worker_processes], f"{worker_name}-{index}", handler_workers, max_pending, metrics_port + index))
+                         for index in range(worker_processes)]
+            for process in processes:
+                os.environ["LOG_FILE"] = worker_log_file(LOG_FILE, process.name)
+                process.start()
+            os.environ["LOG_FILE"] = LOG_FILE
+            for process in processes:
+                process.join()
+    else:
+        start_metrics_server(os.environ.get("METRICS_HOST", "127.0.0.1"), metrics_port)
+        threading.Thread(target=listen_for_place_updates, name="place-updates", daemon=True).start()
+        if bot_mode == "webhook":
+            update_queue = RedisUpdateQueue(redis_client, update_shards) if os.environ.get("UPDATE_QUEUE", "memory") == "redis" else None
+            runtime = WebhookRuntime(bot, os.environ.get("WEBHOOK_URL"), os.environ.get("WEBHOOK_SECRET"),
+                                     host=os.environ.get("WEBHOOK_HOST", "0.0.0.0"), port=int(os.environ.get("WEBHOOK_PORT", 8443)),
+                                     path=os.environ.get("WEBHOOK_PATH", "/telegram"), queue=update_queue,
+                                     max_workers=handler_workers, max_pending=max_pending)
+        else:
+            bot.remove_webhook()
+            runtime = PollingRuntime(bot, max_workers=handler_workers, max_pending=max_pending)
+        run_runtime(runtime)
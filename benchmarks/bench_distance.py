@@ -0,0 +1,61 @@
+import argparse
+import os
+import random
+import sys
+import time
+from math import radians, sin, cos, sqrt, atan2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geopy.distance import geodesic
+
+import distance
+
+
+def scalar_haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 6371 * 2 * atan2(sqrt(a), sqrt(1 - a)) * 1000
+
+
+def per_row(latitude, longitude, lats, lons, range_meters):
+    places = []
+    for lat, lon in zip(lats, lons):
+        if scalar_haversine(latitude, longitude, lat, lon) <= range_meters:
+            places.append(geodesic((latitude, longitude), (lat, lon)).meters)
+    return sorted(places)
+
+
+def timed(function, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - started) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-row and vectorized distance filtering")
+    parser.add_argument("--candidates", type=int, default=2500)
+    parser.add_argument("--radius", type=int, default=5000)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--top-n", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    latitude, longitude = 50.45, 30.52
+    lats = [latitude + rng.uniform(-0.045, 0.045) for _ in range(args.candidates)]
+    lons = [longitude + rng.uniform(-0.07, 0.07) for _ in range(args.candidates)]
+
+    print(f"{args.candidates} candidates, radius {args.radius} m")
+    print(f"per-row haversine + geodesic: {timed(lambda: per_row(latitude, longitude, lats, lons, args.radius), args.repeats):.2f} ms")
+    for mode in (distance.EQUIRECTANGULAR, distance.HAVERSINE):
+        elapsed = timed(lambda: distance.rank_within_range(latitude, longitude, lats, lons, args.radius, mode=mode, geodesic_top_n=args.top_n), args.repeats)
+        print(f"vectorized {mode} + geodesic top {args.top_n}: {elapsed:.2f} ms")
+    elapsed = timed(lambda: distance.rank_within_range(latitude, longitude, lats, lons, args.radius, mode=distance.GEODESIC), max(1, args.repeats // 10))
+    print(f"geodesic for every candidate: {elapsed:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlite_pool import SQLiteConnection, create_schema
+
+min_longitude = 30.28375
+max_longitude = 30.71647
+min_latitude = 50.32881
+max_latitude = 50.58280
+place_types = ["restaurant", "cafe", "bar"]
+weekday_text = "\n- Понеділок: 08:00 - 22:00\n- Вівторок: 08:00 - 22:00\n- Середа: 08:00 - 22:00\n- Четвер: 08:00 - 22:00" \
+               "\n- П'ятниця: 08:00 - 23:00\n- Субота: 09:00 - 23:00\n- Неділя: 09:00 - 21:00"
+
+
+def seed(path, places, photos_per_place, cold_photo_ratio, users, favourites_per_user, store_dir, seed_value):
+    from opening_hours import pack_intervals, periods_to_intervals
+    import photo_store
+
+    rng = random.Random(seed_value)
+    create_schema(path)
+    connection = sqlite3.connect(path)
+    periods = [{"open": {"day": day, "time": "0800"}, "close": {"day": day, "time": "2200"}} for day in range(7)]
+    open_intervals = pack_intervals(periods_to_intervals(periods))
+    checksums = [photo_store.put(rng.randbytes(2048), store_dir) for _ in range(16)]
+
+    batch_size = 10000
+    for start in range(0, places, batch_size):
+        place_rows = []
+        photo_rows = []
+        for i in range(start, min(start + batch_size, places)):
+            place_id = f"place_{i}"
+            place_rows.append((place_id, rng.uniform(min_latitude, max_latitude), rng.uniform(min_longitude, max_longitude),
+                               f"Place {i}", f"Street {i}, Kyiv, Ukraine, 02000", "+380441234567", weekday_text,
+                               round(rng.uniform(3, 5), 1), rng.randint(1, 4), f"https://maps.google.com/?cid={i}",
+                               f"https://place{i}.example.com", 1, 0, 0, 1, 1, 0, 1, open_intervals,
+                               f"{rng.choice(place_types)},food,point_of_interest,establishment", 1, rng.randint(0, 1),
+                               rng.randint(0, 1), "[]"))
+            for _ in range(photos_per_place):
+                file_id = None if rng.random() < cold_photo_ratio else f"file_{rng.getrandbits(48):x}"
+                photo_rows.append((place_id, rng.choice(checksums), 2048, file_id))
+        connection.executemany(f"INSERT INTO Places VALUES ({', '.join(['?'] * 24)})", place_rows)
+        connection.executemany("INSERT INTO PlacePhotos (place_id, checksum, size, telegram_file_id) VALUES (?, ?, ?, ?)", photo_rows)
+        connection.commit()
+
+    now = datetime.datetime.now()
+    for user_id in range(1, users + 1):
+        connection.execute("INSERT INTO Users VALUES (?, ?)", (user_id, "+380000000000"))
+        connection.execute("INSERT INTO user_locations VALUES (?, ?, ?, ?)",
+                           (user_id, rng.uniform(min_latitude, max_latitude), rng.uniform(min_longitude, max_longitude),
+                            now.strftime("%Y-%m-%d %H:%M:%S")))
+        for place in rng.sample(range(places), min(favourites_per_user, places)):
+            connection.execute("INSERT OR IGNORE INTO Favourites VALUES (?, ?)", (f"place_{place}", user_id))
+    connection.commit()
+    connection.close()
+
+
+class StubTelegram:
+    def __init__(self, latency_ms, media_latency_ms):
+        self.latency = latency_ms / 1000
+        self.media_latency = media_latency_ms / 1000
+        self.lock = threading.Lock()
+        self.next_message_id = 1
+        self.calls = 0
+
+    def message(self, chat_id, extra=None):
+        with self.lock:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        message = {"message_id": message_id, "date": int(time.time()), "chat": {"id": int(chat_id), "type": "private"}}
+        message.update(extra or {})
+        return message
+
+    def __call__(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        method_name = url.rsplit("/", 1)[-1]
+        params = params or {}
+        with self.lock:
+            self.calls += 1
+        chat_id = params.get("chat_id", 0)
+        if method_name == "sendMediaGroup":
+            time.sleep(self.media_latency)
+            media = json.loads(params["media"])
+            result = [self.message(chat_id, {"photo": [{"file_id": f"file_{random.getrandbits(48):x}",
+                                                        "file_unique_id": "u", "width": 1, "height": 1}]})
+                      for _ in media]
+        elif method_name in ("sendMessage", "editMessageText"):
+            time.sleep(self.latency)
+            result = self.message(chat_id, {"text": params.get("text", "")})
+        else:
+            time.sleep(self.latency)
+            result = True
+        body = json.dumps({"ok": True, "result": result})
+        return SimpleNamespace(status_code=200, text=body, json=lambda: json.loads(body))
+
+
+def make_message(user_id, text="☕Кафе"):
+    from telebot import types
+
+    return types.Message.de_json({
+        "message_id": 1, "date": int(time.time()), "text": text,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+    })
+
+
+def import_app(db_path, pool_size, log_path):
+    import fakeredis
+    import mysql.connector
+    import redis
+    from telebot import apihelper
+
+    os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+    os.environ["LOG_FILE"] = log_path
+    os.environ.setdefault("LOG_LEVEL", "INFO")
+    server = fakeredis.FakeServer()
+    redis.Redis = lambda *args, **kwargs: fakeredis.FakeRedis(server=server)
+    mysql.connector.connect = lambda **config: SQLiteConnection(db_path)
+    telegram = StubTelegram(0, 0)
+    apihelper.CUSTOM_REQUEST_SENDER = telegram
+    os.environ["MYSQL_POOL_SIZE"] = str(pool_size)
+    import app
+    app.place_index.stop_auto_refresh()
+    return app, telegram
+
+
+def stage_counts(metrics):
+    counts = {}
+    with metrics.stage_seconds.lock:
+        for (handler, stage, operation), (buckets, total) in metrics.stage_seconds.series.items():
+            counts[(handler, stage)] = counts.get((handler, stage), 0) + sum(buckets)
+    return counts
+
+
+def percentiles(values):
+    values = sorted(values)
+    if len(values) < 2:
+        return values * 3 if values else [0, 0, 0]
+    quantiles = statistics.quantiles(values, n=100)
+    return quantiles[49], quantiles[94], quantiles[98]
+
+
+def run_session(app, user_id, radius, timings, lock):
+    chat_id = user_id
+    app.sessions.set(chat_id, "range", radius)
+    location = app.get_latest_position(user_id, 5)
+    latitude, longitude = location["latitude"], location["longitude"]
+    steps = [("search", lambda: app.search(make_message(user_id), type=random.choice(place_types)))]
+    steps.append(("show_next_page", lambda: app.show_next_page(5, 1, chat_id, latitude, longitude)))
+
+    def send_first_place():
+        place_ref, _ = app.sessions.place_ref(chat_id, "places", 0)
+        if place_ref is not None:
+            app.send_place_info(chat_id, user_id, place_ref[0], latitude, longitude)
+
+    steps.append(("send_place_info", send_first_place))
+    for name, step in steps:
+        started = time.perf_counter()
+        step()
+        elapsed = time.perf_counter() - started
+        with lock:
+            timings.setdefault(name, []).append(elapsed * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive search, show_next_page and send_place_info against a synthetic dataset")
+    parser.add_argument("--places", type=int, default=10000)
+    parser.add_argument("--photos-per-place", type=int, default=3)
+    parser.add_argument("--cold-photo-ratio", type=float, default=0.1, help="share of photos without a cached Telegram file_id")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--favourites-per-user", type=int, default=5)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--radius", type=int, default=1000)
+    parser.add_argument("--pool-size", type=int, default=20)
+    parser.add_argument("--telegram-ms", type=float, default=0)
+    parser.add_argument("--media-ms", type=float, default=0)
+    parser.add_argument("--workdir", help="reuse a seeded dataset in this directory")
+    parser.add_argument("--strict-budgets", action="store_true", help="fail on the first handler that exceeds its query budget")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_handlers_")
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, "places.sqlite3")
+    store_dir = os.path.join(workdir, "photo_store")
+    os.environ["PHOTO_STORE_DIR"] = store_dir
+    if not os.path.exists(db_path):
+        started = time.perf_counter()
+        seed(db_path, args.places, args.photos_per_place, args.cold_photo_ratio, args.users, args.favourites_per_user,
+             store_dir, seed_value=17)
+        print(f"Seeded {args.places} places into {db_path} in {time.perf_counter() - started:.1f} s")
+
+    connection = sqlite3.connect(db_path)
+    connection.execute("UPDATE user_locations SET timestamp = ?", (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+    connection.commit()
+    connection.close()
+
+    app, telegram = import_app(db_path, args.pool_size, os.path.join(workdir, "logs.txt"))
+    telegram.latency = args.telegram_ms / 1000
+    telegram.media_latency = args.media_ms / 1000
+    import metrics
+    from query_budget import query_budget, LOG, STRICT
+
+    query_budget.mode = STRICT if args.strict_budgets else LOG
+
+    rng = random.Random(23)
+    timings = {}
+    lock = threading.Lock()
+    before = stage_counts(metrics)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(run_session, app, rng.randint(1, args.users), args.radius, timings, lock)
+                   for _ in range(args.sessions)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+    after = stage_counts(metrics)
+
+    print(f"{args.sessions} sessions, concurrency {args.concurrency}, radius {args.radius} m, "
+          f"{len(app.place_index)} places indexed, {elapsed:.2f} s total")
+    print(f"{'handler':<18} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'mysql/req':>10} {'redis/req':>10} {'tg/req':>8}")
+    for name in ("search", "show_next_page", "send_place_info"):
+        values = timings.get(name, [])
+        p50, p95, p99 = percentiles(values)
+        per_request = {stage: (after.get((name, stage), 0) - before.get((name, stage), 0)) / max(len(values), 1)
+                       for stage in ("mysql", "redis", "telegram")}
+        print(f"{name:<18} {len(values):>6} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f} "
+              f"{per_request['mysql']:>10.2f} {per_request['redis']:>10.2f} {per_request['telegram']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from runtime import PollingRuntime, update_chat_id
+
+
+class StubBot:
+    """Serves pre-generated updates and simulates Redis, MySQL and Telegram latency in handlers."""
+
+    def __init__(self, users, messages_per_user, redis_ms, mysql_ms, telegram_ms, slow_media_ms, slow_media_ratio, seed):
+        self.threaded = True
+        self.rng = random.Random(seed)
+        self.redis_ms = redis_ms
+        self.mysql_ms = mysql_ms
+        self.telegram_ms = telegram_ms
+        self.slow_media_ms = slow_media_ms
+        self.slow_media_ratio = slow_media_ratio
+        self.updates = []
+        for sequence in range(messages_per_user):
+            for chat_id in self.rng.sample(range(1, users + 1), users):
+                message = SimpleNamespace(chat=SimpleNamespace(id=chat_id), sequence=sequence)
+                self.updates.append(SimpleNamespace(update_id=len(self.updates), message=message, received=None))
+        self.position = 0
+        self.lock = threading.Lock()
+        self.last_sequence = {}
+        self.order_violations = 0
+        self.latencies = []
+        self.done = threading.Event()
+
+    def get_updates(self, offset=None, limit=100, timeout=20, allowed_updates=None, long_polling_timeout=20):
+        batch = self.updates[self.position:self.position + limit]
+        if not batch:
+            time.sleep(0.01)
+            return []
+        self.position += len(batch)
+        received = time.perf_counter()
+        for update in batch:
+            update.received = received
+        return batch
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            time.sleep(self.redis_ms / 1000)
+            time.sleep(self.mysql_ms / 1000)
+            slow = self.rng.random() < self.slow_media_ratio
+            time.sleep((self.slow_media_ms if slow else self.telegram_ms) / 1000)
+            chat_id = update_chat_id(update)
+            with self.lock:
+                if self.last_sequence.get(chat_id, -1) >= update.message.sequence:
+                    self.order_violations += 1
+                self.last_sequence[chat_id] = update.message.sequence
+                self.latencies.append(time.perf_counter() - update.received)
+                if len(self.latencies) == len(self.updates):
+                    self.done.set()
+
+
+def run_threaded_polling(bot, num_threads):
+    executor = ThreadPoolExecutor(max_workers=num_threads)
+    while not bot.done.is_set():
+        for update in bot.get_updates(limit=100):
+            executor.submit(bot.process_new_updates, [update])
+    executor.shutdown(wait=True)
+
+
+async def run_runtime(bot, workers):
+    runtime = PollingRuntime(bot, max_workers=workers, limit=100, timeout=0)
+    task = asyncio.create_task(runtime.run())
+    while not bot.done.is_set():
+        await asyncio.sleep(0.01)
+    runtime.stop()
+    await task
+
+
+def report(name, bot, elapsed):
+    latencies = sorted(latency * 1000 for latency in bot.latencies)
+    p50, p95, p99 = (statistics.quantiles(latencies, n=100)[index] for index in (49, 94, 98))
+    print(f"{name}: {len(latencies)} updates in {elapsed:.2f} s ({len(latencies) / elapsed:.0f} updates/s), "
+          f"latency p50 {p50:.0f} ms, p95 {p95:.0f} ms, p99 {p99:.0f} ms, order violations {bot.order_violations}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the polling runtime against stubbed Telegram, MySQL and Redis")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--messages-per-user", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=20)
+    parser.add_argument("--baseline-threads", type=int, default=2, help="TeleBot's default num_threads for bot.polling()")
+    parser.add_argument("--redis-ms", type=float, default=0.5)
+    parser.add_argument("--mysql-ms", type=float, default=3)
+    parser.add_argument("--telegram-ms", type=float, default=40)
+    parser.add_argument("--slow-media-ms", type=float, default=1500)
+    parser.add_argument("--slow-media-ratio", type=float, default=0.01)
+    parser.add_argument("--skip-baseline", action="store_true")
+    args = parser.parse_args()
+
+    def make_bot():
+        return StubBot(args.users, args.messages_per_user, args.redis_ms, args.mysql_ms, args.telegram_ms,
+                       args.slow_media_ms, args.slow_media_ratio, seed=11)
+
+    print(f"{args.users} chats x {args.messages_per_user} updates, {args.workers} runtime workers")
+    if not args.skip_baseline:
+        bot = make_bot()
+        started = time.perf_counter()
+        run_threaded_polling(bot, args.baseline_threads)
+        report(f"bot.polling() with {args.baseline_threads} threads", bot, time.perf_counter() - started)
+
+    bot = make_bot()
+    started = time.perf_counter()
+    asyncio.run(run_runtime(bot, args.workers))
+    report("asyncio runtime", bot, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+import redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import distance
+from runtime import RedisUpdateQueue, StreamWorker, shard_for, stream_key, update_chat_id
+from spatial_index import SpatialIndex
+
+min_longitude = 30.28375
+max_longitude = 30.71647
+min_latitude = 50.32881
+max_latitude = 50.58280
+ranges_list = [250, 500, 1000, 1500, 2000, 3000, 4000, 5000]
+
+
+def generate_rows(count, seed):
+    rng = random.Random(seed)
+    return [(f"place_{i}", rng.uniform(min_latitude, max_latitude), rng.uniform(min_longitude, max_longitude),
+             f"Place {i}", "cafe", f"Street {i}, Kyiv, Ukraine, 02000", None) for i in range(count)]
+
+
+def generate_updates(users, messages_per_user, seed):
+    rng = random.Random(seed)
+    updates = []
+    for sequence in range(messages_per_user):
+        for chat_id in rng.sample(range(1, users + 1), users):
+            updates.append((chat_id, sequence, rng.uniform(min_latitude, max_latitude),
+                            rng.uniform(min_longitude, max_longitude), rng.choice(ranges_list)))
+    return updates
+
+
+def raw_update(update_id, chat_id, sequence, latitude, longitude, radius):
+    return json.dumps({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": f"{sequence} {latitude} {longitude} {radius}",
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+    }})
+
+
+class StubBot:
+    """Runs the search candidate lookup for each update and checks per-chat ordering."""
+
+    def __init__(self, place_index, expected):
+        self.threaded = True
+        self.place_index = place_index
+        self.expected = expected
+        self.lock = threading.Lock()
+        self.last_sequence = {}
+        self.handled = 0
+        self.order_violations = 0
+        self.on_done = None
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            sequence, latitude, longitude, radius = update.message.text.split()
+            sequence, latitude, longitude, radius = int(sequence), float(latitude), float(longitude), int(radius)
+            candidates = self.place_index.candidates(latitude, longitude, radius)
+            if candidates:
+                distance.rank_within_range(latitude, longitude, [place[1] for place in candidates],
+                                           [place[2] for place in candidates], radius, geodesic_top_n=5)
+            chat_id = update_chat_id(update)
+            with self.lock:
+                if self.last_sequence.get(chat_id, -1) >= sequence:
+                    self.order_violations += 1
+                self.last_sequence[chat_id] = sequence
+                self.handled += 1
+                done = self.handled == self.expected
+            if done:
+                self.on_done()
+
+
+def worker(redis_url, shards, consumer, expected, places, handler_workers, ready, start, results):
+    place_index = SpatialIndex()
+    place_index.build(generate_rows(places, seed=3))
+    bot = StubBot(place_index, expected)
+    stream_worker = StreamWorker(bot, redis.Redis.from_url(redis_url), shards, consumer=consumer,
+                                 max_workers=handler_workers, block_ms=100)
+
+    async def consume():
+        loop = asyncio.get_running_loop()
+        bot.on_done = lambda: loop.call_soon_threadsafe(stream_worker.stop)
+        await stream_worker.run()
+
+    ready.put(True)
+    start.wait()
+    asyncio.run(consume())
+    results.put((bot.handled, bot.order_violations))
+
+
+def publish(redis_client, processes, updates):
+    for shard in range(processes):
+        redis_client.delete(stream_key(shard))
+    queue = RedisUpdateQueue(redis_client, processes, max_length=len(updates) + 1)
+    for update_id, (chat_id, sequence, latitude, longitude, radius) in enumerate(updates):
+        queue.publish(chat_id, raw_update(update_id, chat_id, sequence, latitude, longitude, radius))
+    return Counter(shard_for(update[0], processes) for update in updates)
+
+
+def run(redis_url, processes, places, updates, handler_workers):
+    expected = publish(redis.Redis.from_url(redis_url), processes, updates)
+    shards = list(range(processes))
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    results = context.Queue()
+    start = context.Event()
+    workers = []
+    for index in range(processes):
+        worker_shards = shards[index::processes]
+        workers.append(context.Process(target=worker, args=(
+            redis_url, worker_shards, f"bench-{index}", sum(expected[shard] for shard in worker_shards), places,
+            handler_workers, ready, start, results)))
+    for process in workers:
+        process.start()
+    for _ in workers:
+        ready.get()
+
+    started = time.perf_counter()
+    start.set()
+    totals = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - started
+    for process in workers:
+        process.join()
+    return elapsed, sum(total[0] for total in totals), sum(total[1] for total in totals)
+
+
+def start_fake_redis():
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    threading.Thread(target=server.serve_forever, name="fake-redis", daemon=True).start()
+    host, port = server.server_address
+    return f"redis://{host}:{port}/0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput of RedisUpdateQueue sharding across StreamWorker processes")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--messages-per-user", type=int, default=4)
+    parser.add_argument("--places", type=int, default=10000)
+    parser.add_argument("--max-processes", type=int, default=os.cpu_count())
+    parser.add_argument("--handler-workers", type=int, default=4)
+    parser.add_argument("--redis-url", help="use this Redis server instead of an in-process fakeredis TCP server")
+    args = parser.parse_args()
+
+    redis_url = args.redis_url or start_fake_redis()
+    updates = generate_updates(args.users, args.messages_per_user, seed=5)
+    print(f"{len(updates)} updates from {args.users} chats, {args.places} places, {os.cpu_count()} CPUs, {redis_url}")
+    baseline = None
+    processes = 1
+    while processes <= args.max_processes:
+        elapsed, handled, order_violations = run(redis_url, processes, args.places, updates, args.handler_workers)
+        throughput = handled / elapsed
+        baseline = baseline or throughput
+        print(f"{processes:>3} processes: {throughput:>8.0f} updates/s, speedup {throughput / baseline:.2f}x, "
+              f"order violations {order_violations}")
+        processes *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spatial_index import SpatialIndex
+
+min_longitude = 30.28375
+max_longitude = 30.71647
+min_latitude = 50.32881
+max_latitude = 50.58280
+ranges_list = [250, 500, 1000, 1500, 2000, 3000, 4000, 5000]
+place_types = ["restaurant", "cafe", "bar"]
+
+
+def generate_rows(count, seed):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        rows.append((
+            f"place_{i}",
+            rng.uniform(min_latitude, max_latitude),
+            rng.uniform(min_longitude, max_longitude),
+            f"Place {i}",
+            rng.choice(place_types) + "food" + "point_of_interest" + "establishment",
+            f"Street {i}, Kyiv, Ukraine, 02000",
+            None,
+        ))
+    return rows
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark radius searches against the in-memory spatial index")
+    parser.add_argument("--places", type=int, default=20000)
+    parser.add_argument("--searches", type=int, default=500)
+    parser.add_argument("--cell-size", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rows = generate_rows(args.places, args.seed)
+    index = SpatialIndex(cell_size_meters=args.cell_size)
+    started = time.perf_counter()
+    index.build(rows)
+    print(f"Built index of {len(index)} places in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    rng = random.Random(args.seed + 1)
+    print(f"{'radius':>8} {'avg hits':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for radius in ranges_list:
+        timings = []
+        hits = []
+        for _ in range(args.searches):
+            latitude = rng.uniform(50.40, 50.50)
+            longitude = rng.uniform(30.45, 30.60)
+            started = time.perf_counter()
+            candidates = index.candidates(latitude, longitude, radius)
+            timings.append((time.perf_counter() - started) * 1000)
+            hits.append(len(candidates))
+        print(f"{radius:>8} {statistics.mean(hits):>10.1f} {percentile(timings, 0.5):>8.3f} {percentile(timings, 0.95):>8.3f} {max(timings):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from localization import format_weekday_text
+
+WEEKDAY_TEXT = [
+    "Monday: 9:00 AM – 9:00 PM",
+    "Tuesday: 9:00 AM – 9:00 PM",
+    "Wednesday: 9:00 AM – 9:00 PM",
+    "Thursday: 9:00 AM – 9:00 PM",
+    "Friday: 9:00 AM – 11:00 PM",
+    "Saturday: Open 24 hours",
+    "Sunday: Closed",
+]
+
+CARD_HEADER = "☕️ Кав'ярня\n\n📍 Адреса: вулиця Хрещатик, 1, Київ\n🕒 Статус роботи: Відкрито\n⭐ Рейтинг: 4.6\n\n🕓 Графік роботи:\n"
+
+
+def replace_weekdays(text):
+    weekdays = {
+        "Monday": "Понеділок",
+        "Tuesday": "Вівторок",
+        "Wednesday": "Середа",
+        "Thursday": "Четвер",
+        "Friday": "П'ятниця",
+        "Saturday": "Субота",
+        "Sunday": "Неділя",
+    }
+    for weekday, ukrainian_weekday in weekdays.items():
+        text = re.sub(rf"\b{weekday}\b", ukrainian_weekday, text, flags=re.IGNORECASE)
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request weekday localization with pre-rendered text")
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    stored_old = replace_weekdays(format_weekday_text(WEEKDAY_TEXT)).replace("Зачинено 🔒", "Зачинено")
+    stored_new = format_weekday_text(WEEKDAY_TEXT)
+
+    def request_path_old():
+        return replace_weekdays(CARD_HEADER + stored_old).replace("Closed", "Зачинено 🔒")
+
+    def request_path_new():
+        return CARD_HEADER + stored_new
+
+    for name, function in (("regex per request", request_path_old), ("pre-rendered", request_path_new)):
+        elapsed = timeit.timeit(function, number=args.number)
+        print(f"{name:>18}: {elapsed / args.number * 1e6:8.2f} us per card")
+    elapsed = timeit.timeit(lambda: format_weekday_text(WEEKDAY_TEXT), number=args.number)
+    print(f"{'ingest render':>18}: {elapsed / args.number * 1e6:8.2f} us per place (once, offline)")
+
+
+if __name__ == "__main__":
+    main()
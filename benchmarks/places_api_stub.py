@@ -0,0 +1,73 @@
+import argparse
+import hashlib
+import time
+from aiohttp import web
+
+PAGE_SIZE = 20
+MAX_RESULTS = 60
+
+
+class PlacesApiStub:
+    def __init__(self, grid_meters=200, places_per_cell=3, page_token_delay=0.0):
+        self.grid_degrees = grid_meters / 111111
+        self.places_per_cell = places_per_cell
+        self.page_token_delay = page_token_delay
+        self.page_tokens = {}
+        self.requests = 0
+
+    def places_near(self, latitude, longitude, radius, place_type):
+        steps = int(radius / 111111 / self.grid_degrees) + 1
+        base_lat = round(latitude / self.grid_degrees)
+        base_lon = round(longitude / self.grid_degrees)
+        results = []
+        for lat_cell in range(base_lat - steps, base_lat + steps + 1):
+            for lon_cell in range(base_lon - steps, base_lon + steps + 1):
+                for i in range(self.places_per_cell):
+                    digest = hashlib.md5(f"{lat_cell}:{lon_cell}:{place_type}:{i}".encode()).hexdigest()
+                    results.append({
+                        "place_id": f"stub_{digest[:20]}",
+                        "name": f"Stub {place_type} {digest[:6]}",
+                        "types": [place_type],
+                        "geometry": {"location": {"lat": lat_cell * self.grid_degrees, "lng": lon_cell * self.grid_degrees}},
+                    })
+        return results[:MAX_RESULTS]
+
+    def page(self, results, offset):
+        body = {"status": "OK" if results else "ZERO_RESULTS", "results": results[offset:offset + PAGE_SIZE]}
+        if offset + PAGE_SIZE < len(results):
+            token = hashlib.md5(f"{time.monotonic()}:{offset}:{id(results)}".encode()).hexdigest()
+            self.page_tokens[token] = (results, offset + PAGE_SIZE, time.monotonic() + self.page_token_delay)
+            body["next_page_token"] = token
+        return body
+
+    async def nearby_search(self, request):
+        self.requests += 1
+        params = request.query
+        if "pagetoken" in params:
+            stored = self.page_tokens.get(params["pagetoken"])
+            if stored is None or time.monotonic() < stored[2]:
+                return web.json_response({"status": "INVALID_REQUEST", "results": []})
+            del self.page_tokens[params["pagetoken"]]
+            return web.json_response(self.page(stored[0], stored[1]))
+        latitude, longitude = (float(value) for value in params["location"].split(","))
+        results = self.places_near(latitude, longitude, float(params.get("radius", 250)), params.get("type", "restaurant"))
+        return web.json_response(self.page(results, 0))
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/maps/api/place/nearbysearch/json", self.nearby_search)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Google Places Nearby Search API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--page-token-delay", type=float, default=0.0)
+    args = parser.parse_args()
+    stub = PlacesApiStub(page_token_delay=args.page_token_delay)
+    print(f"Serving on http://127.0.0.1:{args.port}/maps/api/place/nearbysearch/json")
+    web.run_app(stub.app(), host="127.0.0.1", port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""SQLite stand-in for the MySQL connections handed out by db_pool.ConnectionPool.
+
+Translates the MySQL dialect used by app.py (%s placeholders, INSERT IGNORE, NOW(),
+multi-statement execute) so the real handlers can run without a MySQL server.
+"""
+import datetime
+import re
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Places (
+    place_id TEXT PRIMARY KEY, latitude REAL, longitude REAL, name TEXT, formatted_address TEXT,
+    international_phone_number TEXT, weekday_text TEXT, rating REAL, price_level INTEGER, url TEXT, website TEXT,
+    serves_beer INTEGER, serves_breakfast INTEGER, serves_brunch INTEGER, serves_dinner INTEGER, serves_lunch INTEGER,
+    serves_vegetarian_food INTEGER, serves_wine INTEGER, open_intervals BLOB, types TEXT, dine_in INTEGER,
+    delivery INTEGER, reservable INTEGER, reviews TEXT
+);
+CREATE TABLE IF NOT EXISTS PlacePhotos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, place_id TEXT, checksum TEXT, size INTEGER, telegram_file_id TEXT
+);
+CREATE INDEX IF NOT EXISTS place_photos_place_id ON PlacePhotos (place_id);
+CREATE TABLE IF NOT EXISTS Favourites (place_id TEXT, tg_user_id INTEGER, PRIMARY KEY (tg_user_id, place_id));
+CREATE TABLE IF NOT EXISTS Users (tg_user_id INTEGER PRIMARY KEY, phone_number TEXT);
+CREATE TABLE IF NOT EXISTS UsersReviews (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, place_id TEXT, name TEXT, tg_user_id INTEGER, score INTEGER, review TEXT,
+    date TEXT
+);
+CREATE TABLE IF NOT EXISTS user_locations (user_id INTEGER, latitude REAL, longitude REAL, timestamp TEXT);
+CREATE INDEX IF NOT EXISTS user_locations_user_id ON user_locations (user_id, timestamp);
+"""
+
+TRANSLATIONS = [
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\bINSERT IGNORE\b", re.IGNORECASE), "INSERT OR IGNORE"),
+    (re.compile(r"\bNOW\(\)", re.IGNORECASE), "datetime('now', 'localtime')"),
+]
+
+sqlite3.register_adapter(datetime.datetime, lambda value: value.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def translate(query):
+    for pattern, replacement in TRANSLATIONS:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+class StatementResult:
+    def __init__(self, rows, with_rows):
+        self.rows = rows
+        self.with_rows = with_rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class SQLiteCursor:
+    def __init__(self, connection, dictionary=False):
+        self.connection = connection
+        self.dictionary = dictionary
+        self.cursor = connection.cursor()
+
+    def execute(self, query, params=(), multi=False):
+        if multi:
+            return self.execute_multi(query, params or ())
+        self.cursor.execute(translate(query), params or ())
+
+    def execute_multi(self, query, params):
+        results = []
+        params = list(params)
+        for statement in filter(None, (part.strip() for part in query.split(";"))):
+            count = statement.count("%s")
+            self.cursor.execute(translate(statement), params[:count])
+            params = params[count:]
+            rows = self.cursor.fetchall() if self.cursor.description else []
+            results.append(StatementResult(rows, self.cursor.description is not None))
+        return iter(results)
+
+    def executemany(self, query, seq_params):
+        self.cursor.executemany(translate(query), seq_params)
+
+    def row(self, row):
+        if row is None or not self.dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self.cursor.description, row)}
+
+    def fetchone(self):
+        return self.row(self.cursor.fetchone())
+
+    def fetchall(self):
+        return [self.row(row) for row in self.cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, path, timeout=30):
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=timeout)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+    @property
+    def in_transaction(self):
+        return self.connection.in_transaction
+
+    def is_connected(self):
+        return True
+
+    def ping(self):
+        self.connection.execute("SELECT 1")
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self.connection, dictionary=dictionary)
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        self.connection.close()
+
+
+def create_schema(path):
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    connection.commit()
+    connection.close()
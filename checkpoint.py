@@ -0,0 +1,91 @@
+import os
+import sqlite3
+import threading
+import time
+
+CHECKPOINT_PATH = os.environ.get("CHECKPOINT_PATH", "checkpoints.sqlite3")
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class CheckpointStore:
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                stage TEXT NOT NULL,
+                key TEXT NOT NULL,
+                fingerprint TEXT,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (stage, key)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS checkpoints_status ON checkpoints (stage, status)")
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def fingerprints(self, stage, status=DONE):
+        with self.lock:
+            rows = self.conn.execute("SELECT key, fingerprint FROM checkpoints WHERE stage = ? AND status = ?",
+                                     (stage, status)).fetchall()
+        return dict(rows)
+
+    def keys(self, stage, status):
+        return list(self.fingerprints(stage, status))
+
+    def pending(self, stage, items):
+        done = self.fingerprints(stage, DONE)
+        for key, fingerprint in items:
+            if key not in done or done[key] != fingerprint:
+                yield key, fingerprint
+
+    def set_status(self, stage, items, status, error=None):
+        now = time.time()
+        rows = [(stage, key, fingerprint, status, error, now) for key, fingerprint in items]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany("""
+                INSERT INTO checkpoints (stage, key, fingerprint, status, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (stage, key) DO UPDATE SET
+                    fingerprint = excluded.fingerprint, status = excluded.status,
+                    error = excluded.error, updated_at = excluded.updated_at
+            """, rows)
+            self.conn.commit()
+
+    def mark_done(self, stage, items):
+        self.set_status(stage, items, DONE)
+
+    def mark_pending(self, stage, items):
+        self.set_status(stage, items, PENDING)
+
+    def mark_failed(self, stage, items, error):
+        self.set_status(stage, items, FAILED, str(error))
+
+    def reset(self, stage):
+        with self.lock:
+            self.conn.execute("DELETE FROM checkpoints WHERE stage = ?", (stage,))
+            self.conn.commit()
+
+    def counts(self, stage):
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM checkpoints WHERE stage = ? GROUP BY status",
+                                     (stage,)).fetchall()
+        return dict(rows)
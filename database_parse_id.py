@@ -1,98 +1,316 @@
-import requests
+import argparse
+import asyncio
 import os
 import math
-import folium
+import time
+import json
+from collections import namedtuple
+import aiohttp
 import mysql.connector
 
+import checkpoint
+from checkpoint import CheckpointStore, CHECKPOINT_PATH
+
 API_KEY = os.environ.get("GOOGLE_API_KEY")
+base_nearby_url = os.environ.get("PLACES_API_URL", "https://maps.googleapis.com/maps/api/place/nearbysearch/json")
+METERS_PER_DEGREE = 111111
+CRAWL_STAGE = "crawl_cell"
+
+class Cell(namedtuple("Cell", ["min_lat", "min_lon", "max_lat", "max_lon", "place_type", "depth"])):
+    @property
+    def center(self):
+        return ((self.min_lat + self.max_lat) / 2, (self.min_lon + self.max_lon) / 2)
+
+    @property
+    def height_meters(self):
+        return (self.max_lat - self.min_lat) * METERS_PER_DEGREE
+
+    @property
+    def width_meters(self):
+        return (self.max_lon - self.min_lon) * METERS_PER_DEGREE * math.cos(math.radians(self.center[0]))
+
+    @property
+    def radius_meters(self):
+        return math.ceil(math.hypot(self.height_meters, self.width_meters) / 2)
+
+    def split(self):
+        mid_lat, mid_lon = self.center
+        return [
+            Cell(self.min_lat, self.min_lon, mid_lat, mid_lon, self.place_type, self.depth + 1),
+            Cell(self.min_lat, mid_lon, mid_lat, self.max_lon, self.place_type, self.depth + 1),
+            Cell(mid_lat, self.min_lon, self.max_lat, mid_lon, self.place_type, self.depth + 1),
+            Cell(mid_lat, mid_lon, self.max_lat, self.max_lon, self.place_type, self.depth + 1),
+        ]
+
+def generate_initial_cells(min_lon, max_lon, min_lat, max_lat, cell_meters, place_types):
+    lat_step = cell_meters / METERS_PER_DEGREE
+    lon_step = cell_meters / (METERS_PER_DEGREE * math.cos(math.radians((min_lat + max_lat) / 2)))
+    cells = []
+    lat = min_lat
+    while lat < max_lat:
+        lon = min_lon
+        while lon < max_lon:
+            for place_type in place_types:
+                cells.append(Cell(lat, lon, min(lat + lat_step, max_lat), min(lon + lon_step, max_lon), place_type, 0))
+            lon += lon_step
+        lat += lat_step
+    return cells
+
+def cell_key(cell):
+    return json.dumps(list(cell))
 
-conn = mysql.connector.connect(
-    host="localhost",
-    user="root",
-    password=os.environ.get("MySQL_PASSWORD"),
-    database="PlacesExploration"
-)
-if conn.is_connected():
-    print("Connected to the MySQL database")
-
-def km_to_degrees(latitude, km):
-    earth_radius_km = 6371.0
-    lat_rad = math.radians(latitude)
-    circumference = 2 * math.pi * earth_radius_km * math.cos(lat_rad)
-    conversion_factor = 360 / circumference
-    degrees = km * conversion_factor
-    return degrees
-
-def generate_circle_coordinates(min_lon, max_lon, min_lat, max_lat, radius_km, offset_meters=250):
-    radius_degrees = km_to_degrees((min_lat + max_lat) / 2, radius_km)
-    lon_step = km_to_degrees((min_lat + max_lat) / 2, offset_meters / 1000)
-    lat_step = km_to_degrees((min_lat + max_lat) / 2, offset_meters / 1000)
-
-    circles = []
-    lon = min_lon
-    while lon <= max_lon:
-        lat = min_lat
-        while lat <= max_lat:
-            circles.append({'latitude': lat, 'longitude': lon})
-            lat += lat_step
-        lon += lon_step
-
-    return circles
+def cell_from_key(key):
+    return Cell(*json.loads(key))
+
+def save_circle_map(cells, path="circle_map.html"):
+    import folium
+
+    center_lat = (min_latitude + max_latitude) / 2
+    center_lon = (min_longitude + max_longitude) / 2
+
+    my_map = folium.Map(location=[center_lat, center_lon], zoom_start=12)
+
+    for cell in cells:
+        folium.Circle(
+            location=list(cell.center),
+            radius=cell.radius_meters,
+            color='blue',
+            fill=True,
+            fill_color='blue',
+            fill_opacity=0.3
+        ).add_to(my_map)
+
+    my_map.save(path)
 
 min_longitude = 30.28375
 max_longitude = 30.71647
 min_latitude = 50.32881
 max_latitude = 50.58280
-circle_radius_km = 0.25
+initial_cell_meters = 2000
+min_cell_meters = 125
+saturation = 60
+place_types = ["restaurant", "cafe", "bar"]
 
-circle_coordinates = generate_circle_coordinates(min_longitude, max_longitude, min_latitude, max_latitude, circle_radius_km)
-#print(circle_coordinates)
 
-center_lat = (min_latitude + max_latitude) / 2
-center_lon = (min_longitude + max_longitude) / 2
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
 
-my_map = folium.Map(location=[center_lat, center_lon], zoom_start=12)
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
 
-for circle in circle_coordinates:
-    folium.Circle(
-        location=[circle['latitude'], circle['longitude']],
-        radius=circle_radius_km*1000,
-        color='blue',
-        fill=True,
-        fill_color='blue',
-        fill_opacity=0.3
-    ).add_to(my_map)
 
-my_map.save("circle_map.html")
+class NearbyCrawler:
+    def __init__(self, conn, api_url=base_nearby_url, api_key=API_KEY, concurrency=8, rate=10,
+                 batch_size=500, flush_interval=30.0, page_token_delay=2.0, max_page_token_retries=5,
+                 min_cell_meters=min_cell_meters, saturation=saturation, checkpoints=None):
+        self.conn = conn
+        self.api_url = api_url
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.limiter = TokenBucket(rate)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.page_token_delay = page_token_delay
+        self.max_page_token_retries = max_page_token_retries
+        self.min_cell_meters = min_cell_meters
+        self.saturation = saturation
+        self.checkpoints = checkpoints
+        self.seen = set()
+        self.pending = []
+        self.flushed = 0
+        self.last_flush = time.monotonic()
+        self.flush_lock = asyncio.Lock()
+        self.unflushed_cells = []
+        self.searched = 0
+        self.requests = 0
+        self.errors = 0
+        self.inserted = 0
+        self.splits = 0
 
-base_nearby_url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-place_types = ["restaurant", "cafe", "bar"]
-for circle in circle_coordinates:
-    for place_type in place_types:
-        latitude = circle["latitude"]
-        longitude = circle["longitude"]
-        nearby_params = {
+    async def get_json(self, session, params):
+        await self.limiter.acquire()
+        self.requests += 1
+        params = {key: value for key, value in params.items() if value is not None}
+        async with session.get(self.api_url, params=params) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Response code: {response.status}")
+            return await response.json(content_type=None)
+
+    async def nearby_search(self, session, latitude, longitude, radius_meters, place_type):
+        params = {
             "location": f"{latitude},{longitude}",
-            "radius": circle_radius_km*1000,
+            "radius": radius_meters,
             "type": place_type,
-            "key": API_KEY,
+            "key": self.api_key,
         }
-        nearby_response = requests.get(base_nearby_url, params=nearby_params)
-        if nearby_response.status_code != 200:
-            print(f"ERROR Response code: {nearby_response.status_code}")
-        else:
-            nearby_data = nearby_response.json()
-
-            if nearby_data['status'] == 'OK':
-                for place in nearby_data['results']:
-                    place_id = place['place_id']
-                    #print(place_id)
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT COUNT(*) FROM Places WHERE place_id = %s", (place_id,))
-                    exists = cursor.fetchone()[0]
-                    if not exists:
-                        cursor.execute("INSERT INTO Places (place_id) VALUES (%s)", (place_id,))
-                        conn.commit()
-                        print(f"Added {place_id} to the Places table")
-                    else:
-                        print(f"{place_id} already exists in the Places table")
+        results = []
+        retries = 0
+        while True:
+            nearby_data = await self.get_json(session, params)
+            status = nearby_data.get('status')
+            if status == 'INVALID_REQUEST' and "pagetoken" in params and retries < self.max_page_token_retries:
+                retries += 1
+                await asyncio.sleep(self.page_token_delay)
+                continue
+            if status == 'ZERO_RESULTS':
+                break
+            if status != 'OK':
+                raise RuntimeError(f"Nearby search status: {status}")
+            results.extend(nearby_data['results'])
+            next_page_token = nearby_data.get('next_page_token')
+            if not next_page_token:
+                break
+            params = {"pagetoken": next_page_token, "key": self.api_key}
+            retries = 0
+            await asyncio.sleep(self.page_token_delay)
+        return results
+
+    def add_places(self, places):
+        for place in places:
+            place_id = place['place_id']
+            if place_id not in self.seen:
+                self.seen.add(place_id)
+                self.pending.append(place_id)
+
+    def insert_place_ids(self, place_ids):
+        placeholders = ", ".join(["(%s)"] * len(place_ids))
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"INSERT IGNORE INTO Places (place_id) VALUES {placeholders}", place_ids)
+            self.conn.commit()
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    def mark_searched(self, cell):
+        self.unflushed_cells.append((cell, self.flushed + len(self.pending)))
+
+    async def flush(self, force=False):
+        async with self.flush_lock:
+            force = force or time.monotonic() - self.last_flush >= self.flush_interval
+            while self.pending and (force or len(self.pending) >= self.batch_size):
+                batch = self.pending[:self.batch_size]
+                inserted = await asyncio.to_thread(self.insert_place_ids, batch)
+                self.pending = self.pending[len(batch):]
+                self.flushed += len(batch)
+                self.inserted += inserted
+                print(f"Added {inserted} of {len(batch)} place ids to the Places table")
+            if force:
+                self.last_flush = time.monotonic()
+            done = [cell for cell, position in self.unflushed_cells if position <= self.flushed]
+            if done:
+                self.unflushed_cells = [(cell, position) for cell, position in self.unflushed_cells if position > self.flushed]
+                self.searched += len(done)
+                self.record(done, checkpoint.DONE)
+
+    def record(self, cells, status, error=None):
+        if self.checkpoints is not None:
+            self.checkpoints.set_status(CRAWL_STAGE, [(cell_key(cell), None) for cell in cells], status, error)
+
+    def should_split(self, cell, results):
+        return len(results) >= self.saturation and min(cell.height_meters, cell.width_meters) / 2 >= self.min_cell_meters
+
+    async def worker(self, session, jobs):
+        while True:
+            cell = await jobs.get()
+            try:
+                latitude, longitude = cell.center
+                places = await self.nearby_search(session, latitude, longitude, cell.radius_meters, cell.place_type)
+                self.add_places(places)
+                if self.should_split(cell, places):
+                    self.splits += 1
+                    children = cell.split()
+                    self.record(children, checkpoint.PENDING)
+                    for child in children:
+                        jobs.put_nowait(child)
+                self.mark_searched(cell)
+                await self.flush()
+            except Exception as e:
+                self.errors += 1
+                self.record([cell], checkpoint.FAILED, e)
+                print(f"ERROR while crawling {cell}: {e}")
+            finally:
+                jobs.task_done()
+
+    async def crawl(self, cells):
+        jobs = asyncio.Queue()
+        self.record(cells, checkpoint.PENDING)
+        for cell in cells:
+            jobs.put_nowait(cell)
+        async with aiohttp.ClientSession() as session:
+            workers = [asyncio.create_task(self.worker(session, jobs)) for _ in range(self.concurrency)]
+            await jobs.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        await self.flush(force=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl Google Places Nearby Search for place ids")
+    parser.add_argument("--api-url", default=base_nearby_url)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=10, help="maximum requests per second")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--flush-interval", type=float, default=30.0,
+                        help="insert a partial batch after this many seconds so searched cells are checkpointed")
+    parser.add_argument("--page-token-delay", type=float, default=2.0)
+    parser.add_argument("--initial-cell-meters", type=int, default=initial_cell_meters)
+    parser.add_argument("--min-cell-meters", type=int, default=min_cell_meters)
+    parser.add_argument("--saturation", type=int, default=saturation,
+                        help="split a cell when a search returns at least this many results")
+    parser.add_argument("--checkpoints", default=CHECKPOINT_PATH, help="checkpoint journal used to resume the crawl")
+    parser.add_argument("--restart", action="store_true", help="discard the saved crawl plan")
+    parser.add_argument("--map", action="store_true", help="save the searched cells to circle_map.html")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(
+        host="localhost",
+        user="root",
+        password=os.environ.get("MySQL_PASSWORD"),
+        database="PlacesExploration"
+    )
+    if conn.is_connected():
+        print("Connected to the MySQL database")
+
+    checkpoints = CheckpointStore(args.checkpoints)
+    if args.restart:
+        checkpoints.reset(CRAWL_STAGE)
+    crawler = NearbyCrawler(conn, api_url=args.api_url, concurrency=args.concurrency, rate=args.rate,
+                            batch_size=args.batch_size, flush_interval=args.flush_interval, page_token_delay=args.page_token_delay,
+                            min_cell_meters=args.min_cell_meters, saturation=args.saturation, checkpoints=checkpoints)
+    counts = checkpoints.counts(CRAWL_STAGE)
+    if counts:
+        cells = [cell_from_key(key) for key in checkpoints.keys(CRAWL_STAGE, checkpoint.PENDING) + checkpoints.keys(CRAWL_STAGE, checkpoint.FAILED)]
+        print(f"Resuming crawl: {len(cells)} pending cells, {counts.get(checkpoint.DONE, 0)} already searched")
+    else:
+        cells = generate_initial_cells(min_longitude, max_longitude, min_latitude, max_latitude,
+                                       args.initial_cell_meters, place_types)
+        print(f"Starting crawl with {len(cells)} cells")
+
+    started = time.monotonic()
+    asyncio.run(crawler.crawl(cells))
+    conn.close()
+    if args.map:
+        save_circle_map([cell_from_key(key) for key in checkpoints.keys(CRAWL_STAGE, checkpoint.DONE)])
+    checkpoints.close()
+    print(f"{crawler.requests} requests, {crawler.searched} cells searched, {crawler.splits} splits, "
+          f"{len(crawler.seen)} unique places, {crawler.inserted} new, {crawler.errors} errors "
+          f"in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
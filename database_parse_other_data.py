@@ -1,21 +1,52 @@
 import requests
 import os
 import mysql.connector
-from mysql.connector import pooling
+import redis
 import logging
 import json
-import datetime
-import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 from googletrans import Translator
 
+from checkpoint import CheckpointStore, CHECKPOINT_PATH, file_fingerprint
+from opening_hours import periods_to_intervals, pack_intervals
+from localization import format_weekday_text
+from place_cards import PLACES_UPDATED_CHANNEL
+
 logging.basicConfig(filename="logs.txt",
                     filemode="a",
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
                     level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DETAILS_STAGE = "place_details"
+DETAILS_DIR = os.environ.get("DETAILS_DIR", "./details_jsons")
+
+try:
+    import orjson
+
+    JSON_DECODER = "orjson"
+
+    def load_json_file(path):
+        with open(path, "rb") as json_file:
+            return orjson.loads(json_file.read())
+
+    def dump_json(value):
+        return orjson.dumps(value).decode("utf-8")
+except ImportError:
+    JSON_DECODER = "json"
+
+    def load_json_file(path):
+        with open(path, "r", encoding="utf-8") as json_file:
+            return json.load(json_file)
+
+    def dump_json(value):
+        return json.dumps(value)
+
 def download_photo(url, file_path):
     try:
         response = requests.get(url)
@@ -36,10 +67,16 @@ dbconfig = {
     "password": os.environ.get("MYSQL_PASSWORD"),
     "database": "PlacesExploration"
 }
-threads = 10
-connection_pool = pooling.MySQLConnectionPool(pool_name="mypool",
-                                              pool_size=threads,
-                                              **dbconfig)
+
+COLUMNS = [
+    "formatted_address", "formatted_phone_number", "international_phone_number",
+    "latitude", "longitude", "northeast_lat", "northeast_lng", "southwest_lat", "southwest_lng",
+    "icon_url", "name", "price_level", "rating", "reservable", "serves_beer", "serves_wine",
+    "takeout", "url", "wheelchair_accessible_entrance", "opening_hours", "weekday_text",
+    "dine_in", "delivery", "business_status", "curbside_pickup", "reviews", "website", "types", "photos",
+    "serves_breakfast", "serves_brunch", "serves_dinner", "serves_lunch", "serves_vegetarian_food",
+    "open_intervals",
+]
 
 translator = Translator()
 
@@ -50,10 +87,9 @@ translator = Translator()
     cursor.execute(insert_query, (place_id,))
     conn.commit()"""
 
-def fetch_place_ids():
+def fetch_place_ids(conn):
+    cursor = conn.cursor()
     try:
-        conn = connection_pool.get_connection()
-        cursor = conn.cursor()
         cursor.execute("SELECT place_id FROM Places")
         place_ids = cursor.fetchall()
         return [row[0] for row in place_ids]
@@ -62,37 +98,10 @@ def fetch_place_ids():
         return []
     finally:
         cursor.close()
-        conn.close()
-
-def replace_weekdays(text):
-    logger.debug(f"Replacing weekdays in text: {text}")
-    weekdays = {
-        "Monday": "Понеділок",
-        "Tuesday": "Вівторок",
-        "Wednesday": "Середа",
-        "Thursday": "Четвер",
-        "Friday": "П'ятниця",
-        "Saturday": "Субота",
-        "Sunday": "Неділя",
-    }
-
-    for weekday, ukrainian_weekday in weekdays.items():
-        pattern = rf"\b{weekday}\b"
-        logger.debug(f"Replacing '{weekday}' with '{ukrainian_weekday}'")
-        text = re.sub(pattern, ukrainian_weekday, text, flags=re.IGNORECASE)
-
-    logger.debug(f"Weekday replacement completed. Text after replacement: {text}")
-    return text
-i = 0
-num_photos = 0
-def process_place(place_id):
-    conn = connection_pool.get_connection()
-    cursor = conn.cursor()
-    
+
+def parse_place(place_id, filepath=None):
     try:
-        filepath = f"./details_jsons/details_data_{place_id}.json"
-        with open(filepath, "r", encoding="utf-8") as json_file:
-            details_data = json.load(json_file)
+        details_data = load_json_file(filepath or details_path(place_id))
 
         if details_data['status'] == 'OK':
             logger.info(f"Place details fetched successfully for {place_id}.")
@@ -149,79 +158,208 @@ def process_place(place_id):
             website = result.get("website")
             photos = result.get("photos")
             types = ''.join(result.get("types", []))
-            weekday_text = None
-            response_weekday_text = ''
-            if opening_hours and "weekday_text" in opening_hours:
-                weekday_text = opening_hours["weekday_text"]
-                for day_text in weekday_text:
-                    if "Closed" in day_text:
-                        response_weekday_text += f"\n- {day_text}"
-                    elif "Open 24 hours" in day_text:
-                        response_weekday_text += f"\n- {day_text.replace('Open 24 hours', 'Відчинено 24 години')}"
-                    else:
-                        day_text = day_text.replace("\u202f", " ")
-                        day_text = day_text.replace("\u2009", " ")
-                        parts = day_text.split('–')
-                        time1_str = parts[0].strip().split(":")
-                        time1_str = time1_str[1].replace(" ", "") + ":" + time1_str[2]
-                        time2_str = parts[1].strip()
-                        try:
-                            time1_obj = datetime.datetime.strptime(time1_str, '%I:%M %p')
-                            time1_24hour = time1_obj.strftime('%H:%M')
-                        except ValueError:
-                            time1_24hour = time1_str
-                        try:
-                            time2_obj = datetime.datetime.strptime(time2_str, '%I:%M %p')
-                            time2_24hour = time2_obj.strftime('%H:%M')
-                        except ValueError:
-                            time2_24hour = time2_str
-                        response_weekday_text += f"\n- " + f"{day_text.split(':')[0]}: {time1_24hour} - {time2_24hour}"
-            else:
-                response_weekday_text += "Графік роботи невідомий :("
-            response_weekday_text = replace_weekdays(response_weekday_text).replace("Closed", "Зачинено")
+            response_weekday_text = format_weekday_text((opening_hours or {}).get("weekday_text"))
             wheelchair_accessible_entrance = result.get("wheelchair_accessible_entrance")
+            open_intervals = None
+            if opening_hours and "periods" in opening_hours:
+                open_intervals = pack_intervals(periods_to_intervals(opening_hours["periods"]))
             
-            sql = """UPDATE Places SET
-                        formatted_address=%s, formatted_phone_number=%s, international_phone_number=%s,
-                        latitude=%s, longitude=%s, northeast_lat=%s, northeast_lng=%s, southwest_lat=%s, southwest_lng=%s,
-                        icon_url=%s, name=%s, price_level=%s, rating=%s, reservable=%s, serves_beer=%s, serves_wine=%s,
-                        takeout=%s, url=%s, wheelchair_accessible_entrance=%s, opening_hours=%s, weekday_text=%s,
-                        dine_in=%s, delivery=%s, business_status=%s, curbside_pickup=%s, reviews=%s, website=%s, types=%s, photos=%s,
-                        serves_breakfast=%s, serves_brunch=%s, serves_dinner=%s, serves_lunch=%s, serves_vegetarian_food=%s
-                        WHERE place_id=%s"""
-            values = (
+            row = (
+                place_id,
                 formatted_address, formatted_phone_number, international_phone_number,
                 latitude, longitude, northeast_lat, northeast_lng, southwest_lat, southwest_lng,
                 icon_url, name, price_level, rating, reservable, serves_beer, serves_wine,
-                takeout, url, wheelchair_accessible_entrance, json.dumps(opening_hours), response_weekday_text,
-                dine_in, delivery, business_status, curbside_pickup, json.dumps(reviews), website, types, json.dumps(photos),
+                takeout, url, wheelchair_accessible_entrance, dump_json(opening_hours), response_weekday_text,
+                dine_in, delivery, business_status, curbside_pickup, dump_json(reviews), website, types, dump_json(photos),
                 serves_breakfast, serves_brunch, serves_dinner, serves_lunch, serves_vegetarian_food,
-                place_id
+                open_intervals,
             )
-            cursor.execute(sql, values)
-            conn.commit()
-            if cursor.rowcount > 0:
-                logger.info(f"Update successful for {place_id}.")
-            else:
-                logger.info(f"Update failed for {place_id}.")
+            return place_id, row, None
         else:
             logger.error(f"details_data['status'] is not OK for {place_id}")
+            return place_id, None, None
     except Exception as e:
-        logger.error(f"Error processing place {place_id}: {e}")
-    finally:
+        return place_id, None, f"Error processing place {place_id}: {e}"
+
+class BulkLoader:
+    def __init__(self, conn):
+        self.conn = conn
+        self.updated = 0
+        self.batches = 0
+        columns = ", ".join(["place_id"] + COLUMNS)
+        placeholders = ", ".join(["%s"] * (len(COLUMNS) + 1))
+        assignments = ", ".join(f"p.{column} = s.{column}" for column in COLUMNS)
+        self.insert_sql = f"INSERT INTO PlacesStaging ({columns}) VALUES ({placeholders})"
+        self.update_sql = f"UPDATE Places p JOIN PlacesStaging s ON p.place_id = s.place_id SET {assignments}"
+
+    def create_staging_table(self):
+        cursor = self.conn.cursor()
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS PlacesStaging")
+        cursor.execute("CREATE TEMPORARY TABLE PlacesStaging LIKE Places")
         cursor.close()
-        conn.close()
 
-place_ids = fetch_place_ids()
+    def load(self, rows):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("DELETE FROM PlacesStaging")
+            cursor.executemany(self.insert_sql, rows)
+            cursor.execute(self.update_sql)
+            self.conn.commit()
+            self.updated += cursor.rowcount
+            self.batches += 1
+            logger.info(f"Batch of {len(rows)} places applied, {cursor.rowcount} rows changed")
+        except mysql.connector.Error:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+class DetailsWriter(threading.Thread):
+    def __init__(self, loader, checkpoints, batch_size, queue_size=10000, redis_client=None):
+        super().__init__(name="details-writer", daemon=True)
+        self.loader = loader
+        self.checkpoints = checkpoints
+        self.redis_client = redis_client
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.rows = []
+        self.batch_keys = []
+
+    def put(self, key, row):
+        self.enqueue((key, row))
 
-with ThreadPoolExecutor(max_workers=threads) as executor:
-    with tqdm(total=len(place_ids)) as progress:
-        futures = [executor.submit(process_place, place_id) for place_id in place_ids]
-        for future in as_completed(futures):
+    def close(self):
+        self.enqueue(None)
+        self.join()
+
+    def enqueue(self, item):
+        while True:
+            if not self.is_alive():
+                raise RuntimeError("Details writer thread has stopped")
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def apply_batch(self):
+        try:
+            if self.rows:
+                self.loader.load(self.rows)
+                self.publish_updates([row[0] for row in self.rows])
+            self.checkpoints.mark_done(DETAILS_STAGE, self.batch_keys)
+        except Exception as e:
+            logger.exception(f"Error applying batch: {e}")
             try:
-                future.result()
-            except Exception as exc:
-                logger.error(f"Generated an exception: {exc}")
-            finally:
+                self.checkpoints.mark_failed(DETAILS_STAGE, self.batch_keys, e)
+            except Exception as e:
+                logger.exception(f"Error marking batch as failed: {e}")
+        self.rows = []
+        self.batch_keys = []
+
+    def publish_updates(self, place_ids):
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.publish(PLACES_UPDATED_CHANNEL, ",".join(place_ids))
+        except redis.RedisError as e:
+            logger.error(f"Error publishing place updates: {e}")
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            key, row = item
+            if row is not None:
+                self.rows.append(row)
+            self.batch_keys.append(key)
+            if len(self.batch_keys) >= self.batch_size:
+                self.apply_batch()
+        self.apply_batch()
+
+def details_path(place_id):
+    return os.path.join(DETAILS_DIR, f"details_data_{place_id}.json")
+
+def iter_details_files(directory, limit=None):
+    count = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if limit is not None and count >= limit:
+                return
+            if entry.is_file() and entry.name.startswith("details_data_") and entry.name.endswith(".json"):
+                count += 1
+                yield entry.name[len("details_data_"):-len(".json")], entry.path
+
+def benchmark_parse(directory, workers, limit=None):
+    files = list(iter_details_files(directory, limit))
+    total_bytes = sum(os.path.getsize(path) for _, path in files)
+    parsed = 0
+    errors = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for place_id, row, error in executor.map(parse_place, *zip(*files), chunksize=64):
+            if error is not None:
+                errors += 1
+            elif row is not None:
+                parsed += 1
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"Parsed {parsed} rows from {len(files)} files ({errors} errors) with {workers} workers using {JSON_DECODER}")
+    print(f"{elapsed:.2f}s, {parsed / elapsed:.0f} rows/s, {total_bytes / elapsed / 1024 / 1024:.2f} MB/s")
+
+def fingerprinted_place_ids(place_ids):
+    for place_id in place_ids:
+        filepath = details_path(place_id)
+        if os.path.exists(filepath):
+            yield place_id, file_fingerprint(filepath)
+
+def main():
+    global DETAILS_DIR
+    parser = argparse.ArgumentParser(description="Load details_jsons into the Places table")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--checkpoints", default=CHECKPOINT_PATH)
+    parser.add_argument("--jsons-dir", default=DETAILS_DIR)
+    parser.add_argument("--parse-only", action="store_true", help="only parse the JSON corpus and report rows/s")
+    parser.add_argument("--limit", type=int, help="parse at most this many files in --parse-only mode")
+    parser.add_argument("--force", action="store_true", help="reprocess every place, ignoring checkpoints")
+    args = parser.parse_args()
+    DETAILS_DIR = args.jsons_dir
+
+    if args.parse_only:
+        benchmark_parse(args.jsons_dir, args.workers, args.limit)
+        return
+
+    conn = mysql.connector.connect(**dbconfig)
+    place_ids = fetch_place_ids(conn)
+    checkpoints = CheckpointStore(args.checkpoints)
+    if args.force:
+        checkpoints.reset(DETAILS_STAGE)
+    pending = list(checkpoints.pending(DETAILS_STAGE, fingerprinted_place_ids(place_ids)))
+    fingerprints = dict(pending)
+    logger.info(f"{len(pending)} of {len(place_ids)} places have new or changed details")
+
+    loader = BulkLoader(conn)
+    loader.create_staging_table()
+    writer = DetailsWriter(loader, checkpoints, args.batch_size, redis_client=redis.Redis())
+    writer.start()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        with tqdm(total=len(pending)) as progress:
+            paths = [details_path(place_id) for place_id in fingerprints]
+            for place_id, row, error in executor.map(parse_place, fingerprints, paths, chunksize=64):
+                if error is not None:
+                    logger.error(error)
+                    checkpoints.mark_failed(DETAILS_STAGE, [(place_id, fingerprints[place_id])], error)
+                else:
+                    writer.put((place_id, fingerprints[place_id]), row)
                 progress.update(1)
+    writer.close()
+
+    logger.info(f"Updated {loader.updated} places in {loader.batches} batches")
+    checkpoints.close()
+    conn.close()
+
 
+if __name__ == "__main__":
+    main()
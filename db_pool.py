@@ -0,0 +1,209 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+
+logger = logging.getLogger(__name__)
+
+CONNECTION = 0
+CREATED = 1
+LAST_USED = 2
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class PoolContextMixin:
+    @contextmanager
+    def connection(self, timeout=None):
+        connection = self.get_connection(timeout=timeout)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextmanager
+    def cursor(self, commit=False, timeout=None, **cursor_kwargs):
+        with self.connection(timeout=timeout) as connection:
+            cursor = connection.cursor(**cursor_kwargs)
+            try:
+                yield cursor
+                if commit:
+                    connection.commit()
+            finally:
+                cursor.close()
+
+
+class PooledConnection:
+    def __init__(self, pool, entry, waited=0.0):
+        self.pool = pool
+        self.entry = entry
+        self.connection = entry[CONNECTION]
+        self.waited = waited
+
+    def close(self):
+        if self.entry is not None:
+            entry, self.entry = self.entry, None
+            self.pool.release(entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+class ConnectionPool(PoolContextMixin):
+    def __init__(self, pool_name="RestAppPool", pool_size=20, max_overflow=10, timeout=5.0, recycle_seconds=3600,
+                 idle_seconds=300, ping_after=1.0, reap_interval=60, connect=None, **db_config):
+        self.pool_name = pool_name
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle_seconds = recycle_seconds
+        self.idle_seconds = idle_seconds
+        self.ping_after = ping_after
+        self.connect = connect or partial(mysql.connector.connect, **db_config)
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.size = 0
+        self.waiting = 0
+        self.closed = False
+        self.stop_event = threading.Event()
+        self.reaper = None
+        if reap_interval:
+            self.reaper = threading.Thread(target=self.run_reaper, args=(reap_interval,), name=f"{pool_name}-reaper",
+                                           daemon=True)
+            self.reaper.start()
+
+    def get_connection(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self.condition:
+            entry = self.acquire(started + timeout, timeout)
+        waited = time.monotonic() - started
+        if entry is not None:
+            if self.alive(entry):
+                return PooledConnection(self, entry, waited)
+            close_quietly(entry[CONNECTION])
+        try:
+            now = time.monotonic()
+            entry = [self.connect(), now, now]
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        return PooledConnection(self, entry, waited)
+
+    def acquire(self, deadline, timeout):
+        while True:
+            if self.closed:
+                raise PoolError(f"Pool {self.pool_name} is closed")
+            if self.idle:
+                return self.idle.pop()
+            if self.size < self.pool_size + self.max_overflow:
+                self.size += 1
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolTimeout(f"Timed out after {timeout} s waiting for a connection from {self.pool_name} "
+                                  f"({self.size} open, {self.waiting} waiting)")
+            self.waiting += 1
+            try:
+                self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+    def alive(self, entry):
+        now = time.monotonic()
+        if now - entry[CREATED] > self.recycle_seconds:
+            return False
+        if now - entry[LAST_USED] < self.ping_after:
+            return True
+        try:
+            entry[CONNECTION].ping()
+            return True
+        except Exception as e:
+            logger.warning(f"Dropping dead connection from {self.pool_name}: {e}")
+            return False
+
+    def expired(self, entry, now):
+        return now - entry[CREATED] > self.recycle_seconds or now - entry[LAST_USED] > self.idle_seconds
+
+    def release(self, entry):
+        connection = entry[CONNECTION]
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except Exception as e:
+            logger.warning(f"Dropping connection from {self.pool_name} that failed to roll back: {e}")
+            self.discard(entry)
+            return
+        entry[LAST_USED] = time.monotonic()
+        with self.condition:
+            if not self.closed and (self.size <= self.pool_size or self.waiting):
+                self.idle.append(entry)
+                self.condition.notify()
+                return
+            self.size -= 1
+            self.condition.notify()
+        close_quietly(connection)
+
+    def discard(self, entry):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+        close_quietly(entry[CONNECTION])
+
+    def reap(self):
+        now = time.monotonic()
+        with self.condition:
+            stale = [entry for entry in self.idle if self.expired(entry, now)]
+            if not stale:
+                return 0
+            self.idle = deque(entry for entry in self.idle if not self.expired(entry, now))
+            self.size -= len(stale)
+            self.condition.notify(len(stale))
+        for entry in stale:
+            close_quietly(entry[CONNECTION])
+        logger.info(f"Reaped {len(stale)} stale connections from {self.pool_name}")
+        return len(stale)
+
+    def run_reaper(self, interval):
+        while not self.stop_event.wait(interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"Error while reaping connections from {self.pool_name}: {e}")
+
+    def stats(self):
+        with self.condition:
+            return {"size": self.size, "idle": len(self.idle), "in_use": self.size - len(self.idle),
+                    "waiting": self.waiting, "pool_size": self.pool_size, "max_overflow": self.max_overflow}
+
+    def close(self):
+        self.stop_event.set()
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, deque()
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for entry in idle:
+            close_quietly(entry[CONNECTION])
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception as e:
+        logger.debug(f"Error while closing connection: {e}")
@@ -0,0 +1,70 @@
+import numpy as np
+from geopy.distance import geodesic
+
+EARTH_RADIUS_METERS = 6371000.0
+
+EQUIRECTANGULAR = "equirectangular"
+HAVERSINE = "haversine"
+GEODESIC = "geodesic"
+MODES = (EQUIRECTANGULAR, HAVERSINE, GEODESIC)
+
+
+def equirectangular(latitude, longitude, lats, lons):
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(lats)
+    x = (np.radians(lons) - np.radians(longitude)) * np.cos((lat1 + lat2) / 2)
+    y = lat2 - lat1
+    return EARTH_RADIUS_METERS * np.sqrt(x * x + y * y)
+
+
+def haversine(latitude, longitude, lats, lons):
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lons) - np.radians(longitude)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def geodesic_distances(latitude, longitude, lats, lons):
+    origin = (latitude, longitude)
+    return np.fromiter((geodesic(origin, (lat, lon)).meters for lat, lon in zip(lats, lons)), dtype=np.float64, count=len(lats))
+
+
+def distances(latitude, longitude, lats, lons, mode=HAVERSINE):
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if mode == EQUIRECTANGULAR:
+        return equirectangular(latitude, longitude, lats, lons)
+    if mode == HAVERSINE:
+        return haversine(latitude, longitude, lats, lons)
+    if mode == GEODESIC:
+        return geodesic_distances(latitude, longitude, lats, lons)
+    raise ValueError(f"Unknown distance mode: {mode}")
+
+
+def rank_within_range(latitude, longitude, lats, lons, range_meters, mode=HAVERSINE, geodesic_top_n=0):
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    result = distances(latitude, longitude, lats, lons, mode=mode)
+    in_range = np.flatnonzero(result <= range_meters)
+    order = in_range[np.argsort(result[in_range], kind="stable")]
+    ranked = result[order]
+
+    if geodesic_top_n and mode != GEODESIC and len(order):
+        scored = 0
+        exact = np.empty(0, dtype=np.float64)
+        while scored < len(order):
+            step = order[scored:scored + geodesic_top_n]
+            exact = np.concatenate((exact, geodesic_distances(latitude, longitude, lats[step], lons[step])))
+            scored += len(step)
+            if scored < len(order) and ranked[scored] > np.partition(exact, geodesic_top_n - 1)[geodesic_top_n - 1]:
+                break
+        ranked = ranked.copy()
+        ranked[:scored] = exact
+        keep = np.flatnonzero(ranked <= range_meters)
+        resorted = keep[np.argsort(ranked[keep], kind="stable")]
+        order = order[resorted]
+        ranked = ranked[resorted]
+
+    return order, ranked
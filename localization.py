@@ -0,0 +1,62 @@
+import datetime
+import re
+
+DEFAULT_LOCALE = "uk"
+
+WEEKDAY_NAMES = {
+    "uk": {
+        "monday": "Понеділок",
+        "tuesday": "Вівторок",
+        "wednesday": "Середа",
+        "thursday": "Четвер",
+        "friday": "П'ятниця",
+        "saturday": "Субота",
+        "sunday": "Неділя",
+    },
+}
+
+PHRASES = {
+    "uk": {
+        "closed": "Зачинено 🔒",
+        "open_24_hours": "Відчинено 24 години",
+        "unknown_hours": " невідомо 😕",
+    },
+}
+
+WEEKDAY_PATTERNS = {
+    locale: re.compile(r"\b(" + "|".join(names) + r")\b", re.IGNORECASE)
+    for locale, names in WEEKDAY_NAMES.items()
+}
+
+
+def translate_weekdays(text, locale=DEFAULT_LOCALE):
+    names = WEEKDAY_NAMES[locale]
+    return WEEKDAY_PATTERNS[locale].sub(lambda match: names[match.group(1).lower()], text)
+
+
+def to_24_hour(time_str):
+    try:
+        return datetime.datetime.strptime(time_str, '%I:%M %p').strftime('%H:%M')
+    except ValueError:
+        return time_str
+
+
+def format_weekday_text(weekday_text, locale=DEFAULT_LOCALE):
+    phrases = PHRASES[locale]
+    if not weekday_text:
+        return phrases["unknown_hours"]
+
+    response_weekday_text = ''
+    for day_text in weekday_text:
+        if "Closed" in day_text:
+            response_weekday_text += f"\n- {day_text.replace('Closed', phrases['closed'])}"
+        elif "Open 24 hours" in day_text:
+            response_weekday_text += f"\n- {day_text.replace('Open 24 hours', phrases['open_24_hours'])}"
+        else:
+            day_text = day_text.replace("\u202f", " ").replace("\u2009", " ")
+            parts = day_text.split('–')
+            time1_str = parts[0].strip().split(":")
+            time1_str = time1_str[1].replace(" ", "") + ":" + time1_str[2]
+            time2_str = parts[1].strip()
+            response_weekday_text += f"\n- {day_text.split(':')[0]}: {to_24_hour(time1_str)} - {to_24_hour(time2_str)}"
+    return translate_weekdays(response_weekday_text, locale)
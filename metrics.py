@@ -0,0 +1,285 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import db_pool
+from db_pool import PoolContextMixin
+from query_budget import query_budget
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, value, *labelvalues):
+        with self.lock:
+            series = self.series.get(labelvalues)
+            if series is None:
+                series = self.series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {labelvalues: (list(counts), total) for labelvalues, (counts, total) in self.series.items()}
+        for labelvalues, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, labelvalues, ("le", bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def set(self, value, *labelvalues):
+        with self.lock:
+            self.values[labelvalues] = value
+
+    def inc(self, amount=1, *labelvalues):
+        with self.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def dec(self, amount=1, *labelvalues):
+        self.inc(-amount, *labelvalues)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self.lock:
+            values = dict(self.values)
+        for labelvalues, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+handler_seconds = registry.register(Histogram(
+    "bot_handler_seconds", "Wall time of bot handlers", ("handler",)))
+stage_seconds = registry.register(Histogram(
+    "bot_stage_seconds", "Time spent in MySQL, Redis and Telegram calls per handler", ("handler", "stage", "operation")))
+pool_wait_seconds = registry.register(Histogram(
+    "mysql_pool_wait_seconds", "Time spent queued for a free pooled MySQL connection", ("pool",)))
+pool_checkout_seconds = registry.register(Histogram(
+    "mysql_pool_checkout_seconds", "Total MySQL connection checkout time including liveness pings and new connects", ("pool",)))
+pool_last_wait = registry.register(Gauge(
+    "mysql_pool_last_wait_seconds", "Wait time of the most recent MySQL connection checkout", ("pool",)))
+pool_in_use = registry.register(Gauge(
+    "mysql_pool_connections_in_use", "MySQL connections currently checked out", ("pool",)))
+
+current = threading.local()
+query_budget.ignore_file(__file__)
+query_budget.ignore_file(db_pool.__file__)
+
+
+def current_handler():
+    return getattr(current, "handler", "background")
+
+
+@contextmanager
+def handler_timer(name):
+    previous = getattr(current, "handler", None)
+    current.handler = name
+    started = time.perf_counter()
+    try:
+        with query_budget.scope(name):
+            yield
+    finally:
+        handler_seconds.observe(time.perf_counter() - started, name)
+        current.handler = previous
+
+
+def timed_handler(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with handler_timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def stage_timer(stage, operation):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, current_handler(), stage, operation)
+
+
+def query_operation(query):
+    words = query.split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, operation, *args, **kwargs):
+        query_budget.record_query()
+        with stage_timer("mysql", query_operation(operation)):
+            return self.cursor.execute(operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        query_budget.record_query()
+        with stage_timer("mysql", query_operation(operation)):
+            return self.cursor.executemany(operation, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class InstrumentedConnection:
+    def __init__(self, connection, pool_name):
+        self.connection = connection
+        self.pool_name = pool_name
+        self.closed = False
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.connection.cursor(*args, **kwargs))
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            pool_in_use.dec(1, self.pool_name)
+        self.connection.close()
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+class InstrumentedPool(PoolContextMixin):
+    def __init__(self, pool):
+        self.pool = pool
+
+    def get_connection(self, *args, **kwargs):
+        pool_name = self.pool.pool_name
+        query_budget.record_checkout()
+        started = time.perf_counter()
+        connection = self.pool.get_connection(*args, **kwargs)
+        checkout = time.perf_counter() - started
+        waited = getattr(connection, "waited", checkout)
+        pool_checkout_seconds.observe(checkout, pool_name)
+        pool_wait_seconds.observe(waited, pool_name)
+        pool_last_wait.set(waited, pool_name)
+        pool_in_use.inc(1, pool_name)
+        return InstrumentedConnection(connection, pool_name)
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+
+def instrument_redis(redis_client):
+    execute_command = redis_client.execute_command
+    pipeline = redis_client.pipeline
+
+    def timed_execute_command(*args, **options):
+        with stage_timer("redis", str(args[0]).upper()):
+            return execute_command(*args, **options)
+
+    def timed_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def timed_execute(*execute_args, **execute_kwargs):
+            with stage_timer("redis", "PIPELINE"):
+                return execute(*execute_args, **execute_kwargs)
+
+        pipe.execute = timed_execute
+        return pipe
+
+    redis_client.execute_command = timed_execute_command
+    redis_client.pipeline = timed_pipeline
+    return redis_client
+
+
+def instrument_bot_api():
+    from telebot import apihelper
+
+    make_request = apihelper._make_request
+    if getattr(make_request, "instrumented", False):
+        return
+
+    @wraps(make_request)
+    def timed_make_request(token, method_name, *args, **kwargs):
+        with stage_timer("telegram", method_name):
+            return make_request(token, method_name, *args, **kwargs)
+
+    timed_make_request.instrumented = True
+    apihelper._make_request = timed_make_request
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host="127.0.0.1", port=9108):
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
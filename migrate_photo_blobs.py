@@ -0,0 +1,94 @@
+import argparse
+import os
+import mysql.connector
+from tqdm import tqdm
+
+import photo_store
+
+ADD_COLUMNS = """
+ALTER TABLE PlacePhotos
+    ADD COLUMN checksum CHAR(64) NULL,
+    ADD COLUMN size INT NULL,
+    ADD COLUMN telegram_file_id VARCHAR(255) NULL,
+    ADD INDEX place_photos_place_id (place_id)
+"""
+DELETE_DUPLICATES = """
+DELETE duplicate FROM PlacePhotos duplicate
+JOIN PlacePhotos kept ON kept.place_id = duplicate.place_id AND kept.checksum = duplicate.checksum AND kept.id < duplicate.id
+"""
+HAS_UNIQUE_INDEX = """
+SELECT COUNT(*) FROM information_schema.STATISTICS
+WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'PlacePhotos' AND INDEX_NAME = 'place_photos_checksum'
+"""
+ADD_UNIQUE_INDEX = "ALTER TABLE PlacePhotos ADD UNIQUE INDEX place_photos_checksum (place_id, checksum)"
+DROP_BLOBS = "ALTER TABLE PlacePhotos DROP COLUMN photo_data"
+
+parser = argparse.ArgumentParser(description="Move PlacePhotos.photo_data BLOBs into the content-addressed photo store")
+parser.add_argument("--batch-size", type=int, default=200)
+parser.add_argument("--add-columns", action="store_true", help="add the checksum/size/telegram_file_id columns first")
+parser.add_argument("--drop-blobs", action="store_true", help="drop photo_data once every row has a checksum")
+args = parser.parse_args()
+
+conn = mysql.connector.connect(
+    host="localhost",
+    user="RestApp",
+    password=os.environ.get("MYSQL_PASSWORD"),
+    database="PlacesExploration"
+)
+cursor = conn.cursor()
+
+if args.add_columns:
+    cursor.execute(ADD_COLUMNS)
+    conn.commit()
+
+cursor.execute("SELECT COUNT(*) FROM PlacePhotos WHERE checksum IS NULL")
+pending = cursor.fetchone()[0]
+
+last_id = 0
+empty = 0
+with tqdm(total=pending, desc="Migrating photos") as pbar:
+    while True:
+        cursor.execute(
+            "SELECT id, photo_data FROM PlacePhotos WHERE checksum IS NULL AND id > %s ORDER BY id LIMIT %s",
+            (last_id, args.batch_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = []
+        empty_ids = []
+        for photo_id, photo_data in rows:
+            if photo_data is not None:
+                updates.append((photo_store.put(photo_data), len(photo_data), photo_id))
+            else:
+                empty_ids.append((photo_id,))
+            last_id = photo_id
+        cursor.executemany("UPDATE PlacePhotos SET checksum = %s, size = %s WHERE id = %s", updates)
+        cursor.executemany("DELETE FROM PlacePhotos WHERE id = %s", empty_ids)
+        conn.commit()
+        empty += len(empty_ids)
+        pbar.update(len(rows))
+
+if empty:
+    print(f"Deleted {empty} photos without photo_data")
+
+cursor.execute(HAS_UNIQUE_INDEX)
+if not cursor.fetchone()[0]:
+    cursor.execute(DELETE_DUPLICATES)
+    print(f"Removed {cursor.rowcount} duplicate photos")
+    conn.commit()
+    cursor.execute(ADD_UNIQUE_INDEX)
+    conn.commit()
+
+if args.drop_blobs:
+    cursor.execute("SELECT COUNT(*) FROM PlacePhotos WHERE checksum IS NULL")
+    remaining = cursor.fetchone()[0]
+    if remaining:
+        print(f"{remaining} photos have no checksum yet, keeping photo_data")
+    else:
+        cursor.execute(DROP_BLOBS)
+        conn.commit()
+        print("Dropped PlacePhotos.photo_data")
+
+cursor.close()
+conn.close()
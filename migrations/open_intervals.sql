@@ -0,0 +1,4 @@
+-- Opening hours as packed little-endian uint16 minute-of-week bounds (start, end, start, end, ...),
+-- Sunday 00:00 = 0, as written by database_parse_other_data.py.
+-- Backfill existing rows with: python database_parse_other_data.py --force
+ALTER TABLE Places ADD COLUMN open_intervals VARBINARY(512) NULL;
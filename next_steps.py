@@ -0,0 +1,46 @@
+import logging
+
+from telebot import Handler
+from telebot.handler_backends import HandlerBackend
+
+from session_store import encode, decode
+
+logger = logging.getLogger(__name__)
+
+NEXT_STEPS_FIELD = "next_steps"
+
+
+class SessionStepBackend(HandlerBackend):
+    def __init__(self, sessions):
+        super().__init__()
+        self.sessions = sessions
+        self.steps = {}
+
+    def step(self, callback):
+        self.steps[callback.__name__] = callback
+        return callback
+
+    def register_handler(self, handler_group_id, handler):
+        name = handler.callback.__name__
+        if self.steps.get(name) is not handler.callback:
+            raise ValueError(f"Next step handler {name} is not registered")
+        value = self.sessions.get(handler_group_id, NEXT_STEPS_FIELD)
+        steps = decode(value) if value else []
+        steps.append([name, list(handler.args), handler.kwargs])
+        self.sessions.set(handler_group_id, NEXT_STEPS_FIELD, encode(steps))
+
+    def clear_handlers(self, handler_group_id):
+        self.sessions.delete(handler_group_id, NEXT_STEPS_FIELD)
+
+    def get_handlers(self, handler_group_id):
+        value = self.sessions.pop(handler_group_id, NEXT_STEPS_FIELD)
+        if not value:
+            return None
+        handlers = []
+        for name, args, kwargs in decode(value):
+            callback = self.steps.get(name)
+            if callback is None:
+                logger.error(f"Unknown next step handler {name} for chat {handler_group_id}")
+                continue
+            handlers.append(Handler(callback, *args, **kwargs))
+        return handlers
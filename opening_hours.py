@@ -0,0 +1,59 @@
+import datetime
+import struct
+from bisect import bisect_right
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def to_minute_of_week(day, hhmm):
+    return day * MINUTES_PER_DAY + int(hhmm[:2]) * 60 + int(hhmm[2:4])
+
+
+def current_minute_of_week(now=None):
+    now = now or datetime.datetime.now()
+    return ((now.weekday() + 1) % 7) * MINUTES_PER_DAY + now.hour * 60 + now.minute
+
+
+def periods_to_intervals(periods):
+    intervals = []
+    for period in periods or []:
+        if "close" not in period:
+            return (0, MINUTES_PER_WEEK)
+        start = to_minute_of_week(period["open"]["day"], period["open"]["time"])
+        end = to_minute_of_week(period["close"]["day"], period["close"]["time"])
+        if end <= start:
+            intervals.append((start, MINUTES_PER_WEEK))
+            intervals.append((0, end))
+        else:
+            intervals.append((start, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if start == end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return tuple(bound for interval in merged for bound in interval)
+
+
+def pack_intervals(intervals):
+    return struct.pack(f"<{len(intervals)}H", *intervals)
+
+
+def unpack_intervals(data):
+    if data is None:
+        return None
+    return struct.unpack(f"<{len(data) // 2}H", data)
+
+
+def is_open_at(intervals, minute_of_week):
+    return bisect_right(intervals, minute_of_week) % 2 == 1
+
+
+def is_open_now(intervals, now=None):
+    if not intervals:
+        return False
+    return is_open_at(intervals, current_minute_of_week(now))
@@ -1,48 +1,169 @@
+import argparse
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import mysql.connector
 from tqdm import tqdm
 
+import photo_store
+from checkpoint import CheckpointStore, CHECKPOINT_PATH
+
+PHOTOS_STAGE = "place_photos"
+
 photos_directory = "/home/koval/Restaurants-Exploration-App-DATABASE/photos"
 jsons_directory = "/home/koval/Restaurants-Exploration-App-DATABASE/details_jsons"
-jsons_paths = os.listdir(jsons_directory)
-jsons_paths = [os.path.join(jsons_directory, item) for item in jsons_paths]
-
-conn = mysql.connector.connect(
-    host="localhost",
-    user="RestApp",
-    password=os.environ.get("MYSQL_PASSWORD"),
-    database="PlacesExploration"
-)
-
-def image_to_bytes(image_path):
-    with open(image_path, 'rb') as image_file:
-        image_bytes = image_file.read()
-    return image_bytes
-
-# Initialize the progress bar
-with tqdm(total=len(jsons_paths), desc="Processing JSON files") as pbar:
-    for path in jsons_paths:
-        with open(path, 'r') as file:
-            data = json.load(file)
-            if data["status"] == "OK":
-                place_id = data["result"]["place_id"]
-                if "photos" in data["result"]:
-                    photos = data["result"]["photos"]
-                    for i in range(len(photos)):
-                        photo_reference = photos[i]["photo_reference"]
-                        photo_path_new = os.path.join(photos_directory, f"{place_id}_photos", f"{photo_reference}.jpg")
-                        if os.path.isfile(photo_path_new):
-                            image_bytes = image_to_bytes(photo_path_new)
-                            cursor = conn.cursor()
-                            query = """
-                                    INSERT INTO PlacePhotos (place_id, photo_data)
-                                    VALUES (%s, %s)
-                                """
-                            values = (place_id, image_bytes)
-                            try:
-                                cursor.execute(query, values)
-                                conn.commit()
-                            except mysql.connector.Error as error:
-                                print("Failed to insert data: {}".format(error))
-        pbar.update(1)
+
+INSERT_QUERY = """
+    INSERT IGNORE INTO PlacePhotos (place_id, checksum, size)
+    VALUES (%s, %s, %s)
+"""
+
+
+def iter_json_files(directory):
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                yield entry.name, f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def load_existing_checksums(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT place_id, checksum FROM PlacePhotos WHERE checksum IS NOT NULL")
+    existing = set(cursor.fetchall())
+    cursor.close()
+    return existing
+
+
+def read_place_photos(path, photos_dir):
+    with open(path, 'r') as file:
+        data = json.load(file)
+    if data["status"] != "OK":
+        return []
+    place_id = data["result"]["place_id"]
+    photos = []
+    for photo in data["result"].get("photos", []):
+        photo_path = os.path.join(photos_dir, f"{place_id}_photos", f"{photo['photo_reference']}.jpg")
+        if os.path.isfile(photo_path):
+            with open(photo_path, 'rb') as image_file:
+                image_bytes = image_file.read()
+            photos.append((place_id, photo_store.put(image_bytes), len(image_bytes)))
+    return photos
+
+
+class BatchWriter:
+    def __init__(self, conn, batch_size, checkpoints):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.checkpoints = checkpoints
+        self.rows = []
+        self.files = []
+        self.inserted = 0
+        self.lock = threading.Lock()
+
+    def add(self, json_file, rows):
+        with self.lock:
+            self.rows.extend(rows)
+            self.files.append(json_file)
+            if len(self.rows) >= self.batch_size or len(self.files) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            cursor = self.conn.cursor()
+            try:
+                cursor.executemany(INSERT_QUERY, self.rows)
+                self.conn.commit()
+                self.inserted += cursor.rowcount
+            except mysql.connector.Error as error:
+                self.conn.rollback()
+                print("Failed to insert data: {}".format(error))
+                self.checkpoints.mark_failed(PHOTOS_STAGE, self.files, error)
+                self.files = []
+            finally:
+                cursor.close()
+        self.checkpoints.mark_done(PHOTOS_STAGE, self.files)
+        self.rows = []
+        self.files = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import downloaded place photos into the photo store and PlacePhotos")
+    parser.add_argument("--jsons-dir", default=jsons_directory)
+    parser.add_argument("--photos-dir", default=photos_directory)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--checkpoints", default=CHECKPOINT_PATH)
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(
+        host="localhost",
+        user="RestApp",
+        password=os.environ.get("MYSQL_PASSWORD"),
+        database="PlacesExploration"
+    )
+    existing = load_existing_checksums(conn)
+    checkpoints = CheckpointStore(args.checkpoints)
+    writer = BatchWriter(conn, args.batch_size, checkpoints)
+
+    files = 0
+    photos = 0
+    skipped = 0
+    total_bytes = 0
+    started = time.monotonic()
+    max_in_flight = args.workers * 4
+    futures = {}
+
+    def handle(future):
+        nonlocal files, photos, skipped, total_bytes
+        files += 1
+        json_file = futures.pop(future)
+        try:
+            place_photos = future.result()
+        except Exception as e:
+            print(f"Error: {e}")
+            checkpoints.mark_failed(PHOTOS_STAGE, [json_file], e)
+            return
+        new_rows = []
+        for row in place_photos:
+            total_bytes += row[2]
+            if (row[0], row[1]) in existing:
+                skipped += 1
+                continue
+            existing.add((row[0], row[1]))
+            photos += 1
+            new_rows.append(row)
+        writer.add(json_file, new_rows)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor, tqdm(desc="Processing JSON files", unit="file") as pbar:
+        in_flight = set()
+        for json_file in checkpoints.pending(PHOTOS_STAGE, iter_json_files(args.jsons_dir)):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    handle(future)
+                pbar.update(len(done))
+            future = executor.submit(read_place_photos, os.path.join(args.jsons_dir, json_file[0]), args.photos_dir)
+            futures[future] = json_file
+            in_flight.add(future)
+        for future in in_flight:
+            handle(future)
+            pbar.update(1)
+
+    writer.flush()
+    conn.close()
+    checkpoints.close()
+
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print(f"Processed {files} files and {photos + skipped} photos ({skipped} already present, {writer.inserted} inserted) in {elapsed:.1f}s")
+    print(f"Throughput: {files / elapsed:.1f} files/s, {total_bytes / elapsed / 1024 / 1024:.2f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import hashlib
+import os
+import tempfile
+
+PHOTO_STORE_DIR = os.environ.get("PHOTO_STORE_DIR", "./photo_store")
+
+
+def checksum_for(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def path_for(checksum, store_dir=PHOTO_STORE_DIR):
+    return os.path.join(store_dir, checksum[:2], f"{checksum}.jpg")
+
+
+def exists(checksum, store_dir=PHOTO_STORE_DIR):
+    return os.path.isfile(path_for(checksum, store_dir))
+
+
+def put(data, store_dir=PHOTO_STORE_DIR):
+    checksum = checksum_for(data)
+    path = path_for(checksum, store_dir)
+    if not os.path.isfile(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as photo_file:
+                photo_file.write(data)
+                os.fchmod(photo_file.fileno(), 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return checksum
+
+
+def read(checksum, store_dir=PHOTO_STORE_DIR):
+    with open(path_for(checksum, store_dir), "rb") as photo_file:
+        return photo_file.read()
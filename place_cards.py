@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from localization import DEFAULT_LOCALE
+
+PLACES_UPDATED_CHANNEL = "places_updated"
+
+
+class TTLCache:
+    def __init__(self, max_size=10000, ttl_seconds=3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, predicate):
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+@dataclass
+class CardTemplate:
+    place_id: str
+    latitude: float
+    longitude: float
+    name: str
+    address_block: str
+    details_block: str
+    website: str
+    open_intervals: tuple
+
+
+@dataclass
+class PlaceCard:
+    place_id: str
+    website: str
+    is_favourite: bool
+    photos: list = field(default_factory=list)
+
+
+def build_card_template(detail):
+    address_block = f"📍 Адреса: {detail.address}\n"
+    address_block += f"📞 Номер телефону: {detail.international_phone_number.replace(' ', '')}\n" if detail.international_phone_number is not None else ''
+
+    details_block = f"⭐ Рейтинг: {detail.rating if detail.rating is not None else 'Невідомо 😕'}\n"
+    details_block += f"💰 Рівень Ціни: {detail.price_level}\n" if detail.price_level is not None else ''
+    details_block += '🪑 Є місця всередині\n' if detail.dine_in else ''
+    details_block += '🚚 Є доставка\n' if detail.delivery else ''
+    details_block += '📅 Можливе бронювання\n' if detail.reservable else ''
+    details_block += "\n🕓 Графік роботи:\n"
+    if detail.weekday_text:
+        details_block += detail.weekday_text
+
+    return CardTemplate(detail.place_id, detail.latitude, detail.longitude, detail.name,
+                        address_block, details_block, detail.website, detail.open_intervals)
+
+
+def render_card(template, is_favourite, open_now, distance=None):
+    response = f"☕️ {template.name}" + ("⭐️\n\n" if is_favourite else "\n\n")
+    response += template.address_block
+    response += f"🕒 Статус роботи: {'Відкрито' if open_now else 'Закрито'}\n"
+    response += f"📏 Відстань: {int(distance)} метрів\n" if distance is not None else ''
+    response += template.details_block
+    return response
+
+
+class CardCache:
+    def __init__(self, max_size=10000, ttl_seconds=3600):
+        self.templates = TTLCache(max_size, ttl_seconds)
+
+    def get(self, place_id, locale=DEFAULT_LOCALE):
+        return self.templates.get((place_id, locale))
+
+    def set(self, template, locale=DEFAULT_LOCALE):
+        self.templates.set((template.place_id, locale), template)
+
+    def invalidate(self, place_ids):
+        place_ids = set(place_ids)
+        self.templates.invalidate(lambda key: key[0] in place_ids)
@@ -0,0 +1,91 @@
+from dataclasses import dataclass, field
+
+from opening_hours import unpack_intervals
+
+PHOTOS_QUERY = "SELECT id, checksum, telegram_file_id FROM PlacePhotos WHERE place_id = %s AND checksum IS NOT NULL ORDER BY id"
+
+PLACE_DETAIL_QUERY = """
+SELECT p.place_id, p.latitude, p.longitude, p.name, p.formatted_address, p.weekday_text, p.rating, p.price_level,
+       p.url, p.website, p.serves_beer, p.serves_breakfast, p.serves_brunch, p.serves_dinner, p.serves_lunch,
+       p.serves_vegetarian_food, p.serves_wine, p.open_intervals, p.types, p.dine_in, p.delivery, p.reservable,
+       p.international_phone_number,
+       EXISTS(SELECT 1 FROM Favourites f WHERE f.place_id = p.place_id AND f.tg_user_id = %s) AS is_favourite
+FROM Places p
+WHERE p.place_id = %s;
+""" + PHOTOS_QUERY
+
+PLACE_OVERLAY_QUERY = """
+SELECT EXISTS(SELECT 1 FROM Favourites WHERE place_id = %s AND tg_user_id = %s);
+""" + PHOTOS_QUERY
+
+PLACE_REVIEWS_QUERY = """
+SELECT id, name, score, review, date FROM UsersReviews WHERE place_id = %s ORDER BY date DESC;
+SELECT reviews FROM Places WHERE place_id = %s;
+"""
+
+
+@dataclass
+class PlacePhoto:
+    id: int
+    checksum: str
+    telegram_file_id: str = None
+
+
+@dataclass
+class PlaceDetail:
+    place_id: str
+    latitude: float
+    longitude: float
+    name: str
+    address: str
+    weekday_text: str
+    rating: float
+    price_level: int
+    url: str
+    website: str
+    serves_beer: bool
+    serves_breakfast: bool
+    serves_brunch: bool
+    serves_dinner: bool
+    serves_lunch: bool
+    serves_vegetarian_food: bool
+    serves_wine: bool
+    open_intervals: tuple
+    types: str
+    dine_in: bool
+    delivery: bool
+    reservable: bool
+    international_phone_number: str
+    is_favourite: bool
+    photos: list = field(default_factory=list)
+
+
+def execute_multi(pool, query, params):
+    with pool.cursor() as cursor:
+        return [result.fetchall() for result in cursor.execute(query, params, multi=True) if result.with_rows]
+
+
+def fetch_place_detail(pool, place_id, user_id):
+    place_rows, photo_rows = execute_multi(pool, PLACE_DETAIL_QUERY, (user_id, place_id, place_id))
+    if not place_rows:
+        return None
+    place = place_rows[0]
+    return PlaceDetail(*place[:17], unpack_intervals(place[17]), *place[18:23], bool(place[23]),
+                       photos=[PlacePhoto(*photo) for photo in photo_rows])
+
+
+def fetch_place_overlay(pool, place_id, user_id):
+    favourite_rows, photo_rows = execute_multi(pool, PLACE_OVERLAY_QUERY, (place_id, user_id, place_id))
+    return bool(favourite_rows[0][0]), [PlacePhoto(*photo) for photo in photo_rows]
+
+
+def fetch_place_reviews(pool, place_id):
+    review_rows, place_rows = execute_multi(pool, PLACE_REVIEWS_QUERY, (place_id, place_id))
+    return review_rows, place_rows[0][0] if place_rows else None
+
+
+def update_photo_file_ids(pool, file_ids):
+    if not file_ids:
+        return
+    with pool.cursor(commit=True) as cursor:
+        cursor.executemany("UPDATE PlacePhotos SET telegram_file_id = %s WHERE id = %s", file_ids)
@@ -0,0 +1,118 @@
+import contextlib
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+OFF = "off"
+LOG = "log"
+STRICT = "strict"
+
+QUERY_BUDGET_MODE = os.environ.get("QUERY_BUDGET", OFF)
+
+DEFAULT_BUDGETS = {
+    "search": (2, 2),
+    "show_next_page": (0, 0),
+    "show_prev_page": (0, 0),
+    "send_place_info": (2, 2),
+    "show_favourites": (2, 2),
+    "handle_navigation:sendplace": (2, 2),
+    "handle_navigation:sendreviews": (1, 1),
+    "handle_navigation:nextpage": (0, 0),
+    "handle_navigation:prevpage": (0, 0),
+}
+
+IGNORED_FILES = {os.path.abspath(__file__), os.path.abspath(contextlib.__file__)}
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def parse_budgets(value):
+    budgets = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, limits = item.split("=")
+        queries, checkouts = limits.split("/")
+        budgets[name.strip()] = (int(queries), int(checkouts))
+    return budgets
+
+
+class QueryBudget:
+    def __init__(self, mode=QUERY_BUDGET_MODE, budgets=None):
+        self.mode = mode
+        self.budgets = dict(DEFAULT_BUDGETS)
+        self.budgets.update(budgets if budgets is not None else parse_budgets(os.environ.get("QUERY_BUDGETS", "")))
+        self.local = threading.local()
+
+    def ignore_file(self, path):
+        IGNORED_FILES.add(os.path.abspath(path))
+
+    def scopes(self):
+        scopes = getattr(self.local, "scopes", None)
+        if scopes is None:
+            scopes = self.local.scopes = []
+        return scopes
+
+    @contextmanager
+    def scope(self, handler):
+        if self.mode == OFF or handler not in self.budgets:
+            yield
+            return
+        scope = {"handler": handler, "queries": Counter(), "checkouts": Counter()}
+        scopes = self.scopes()
+        scopes.append(scope)
+        try:
+            yield
+        finally:
+            scopes.pop()
+        self.check(scope)
+
+    def record(self, kind):
+        scopes = getattr(self.local, "scopes", None)
+        if not scopes:
+            return
+        site = call_site()
+        for scope in scopes:
+            scope[kind][site] += 1
+
+    def record_query(self):
+        self.record("queries")
+
+    def record_checkout(self):
+        self.record("checkouts")
+
+    def check(self, scope):
+        max_queries, max_checkouts = self.budgets[scope["handler"]]
+        queries = sum(scope["queries"].values())
+        checkouts = sum(scope["checkouts"].values())
+        if queries <= max_queries and checkouts <= max_checkouts:
+            return
+        message = (f"Query budget exceeded in {scope['handler']}: {queries}/{max_queries} queries, "
+                   f"{checkouts}/{max_checkouts} pool checkouts. Query sites: {format_sites(scope['queries'])}. "
+                   f"Checkout sites: {format_sites(scope['checkouts'])}")
+        if self.mode == STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+def format_sites(sites):
+    return "; ".join(f"{site} x{count}" for site, count in sites.most_common()) or "none"
+
+
+def call_site(depth=2):
+    frame = sys._getframe(1)
+    while frame is not None and os.path.abspath(frame.f_code.co_filename) in IGNORED_FILES:
+        frame = frame.f_back
+    sites = []
+    while frame is not None and len(sites) < depth:
+        sites.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} ({frame.f_code.co_name})")
+        frame = frame.f_back
+    return " <- ".join(sites)
+
+
+query_budget = QueryBudget()
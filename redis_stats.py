@@ -0,0 +1,103 @@
+import argparse
+import os
+import re
+from collections import defaultdict
+
+import redis
+
+from runtime import UPDATES_STREAM_PREFIX
+from session_store import CHAT_KEY_PREFIX
+
+CHAT_HASH_PATTERN = re.compile(rf"^{CHAT_KEY_PREFIX}:-?\d+$")
+CHAT_LIST_PATTERN = re.compile(rf"^{CHAT_KEY_PREFIX}:-?\d+:(?P<name>.+)$")
+SEARCH_CACHE_PATTERN = re.compile(r"^(?P<prefix>search_cache):")
+UPDATES_STREAM_PATTERN = re.compile(rf"^{UPDATES_STREAM_PREFIX}:\d+$")
+
+
+def key_family(key):
+    if CHAT_HASH_PATTERN.match(key):
+        return f"{CHAT_KEY_PREFIX}:<id>"
+    match = CHAT_LIST_PATTERN.match(key)
+    if match:
+        return f"{CHAT_KEY_PREFIX}:<id>:{match.group('name')}"
+    match = SEARCH_CACHE_PATTERN.match(key)
+    if match:
+        return f"{match.group('prefix')}:*"
+    if UPDATES_STREAM_PATTERN.match(key):
+        return f"{UPDATES_STREAM_PREFIX}:*"
+    return "legacy"
+
+
+def collect_stats(redis_client, scan_count=1000, with_memory=True):
+    stats = defaultdict(lambda: {"keys": 0, "bytes": 0, "no_ttl": 0})
+    batch = []
+
+    def flush():
+        pipe = redis_client.pipeline(transaction=False)
+        for key in batch:
+            pipe.ttl(key)
+            if with_memory:
+                pipe.memory_usage(key)
+        results = pipe.execute()
+        step = 2 if with_memory else 1
+        for index, key in enumerate(batch):
+            family = stats[key_family(key.decode("utf-8", errors="replace"))]
+            family["keys"] += 1
+            if results[index * step] == -1:
+                family["no_ttl"] += 1
+            if with_memory:
+                family["bytes"] += results[index * step + 1] or 0
+        batch.clear()
+
+    for key in redis_client.scan_iter(count=scan_count):
+        batch.append(key)
+        if len(batch) >= scan_count:
+            flush()
+    if batch:
+        flush()
+    return dict(stats)
+
+
+def expire_legacy_keys(redis_client, ttl_seconds, scan_count=1000):
+    expired = 0
+    pipe = redis_client.pipeline(transaction=False)
+    for key in redis_client.scan_iter(count=scan_count):
+        if key_family(key.decode("utf-8", errors="replace")) == "legacy":
+            pipe.expire(key, ttl_seconds, nx=True)
+            expired += 1
+            if expired % scan_count == 0:
+                pipe.execute()
+    pipe.execute()
+    return expired
+
+
+def print_stats(stats):
+    total_keys = sum(family["keys"] for family in stats.values())
+    total_bytes = sum(family["bytes"] for family in stats.values())
+    print(f"{'family':<32} {'keys':>10} {'no ttl':>10} {'memory, KB':>12} {'avg, B':>8}")
+    for name, family in sorted(stats.items(), key=lambda item: item[1]["bytes"], reverse=True):
+        average = family["bytes"] // family["keys"] if family["keys"] else 0
+        print(f"{name:<32} {family['keys']:>10} {family['no_ttl']:>10} {family['bytes'] / 1024:>12.1f} {average:>8}")
+    print(f"{'total':<32} {total_keys:>10} {'':>10} {total_bytes / 1024:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report Redis key counts and memory usage per key family")
+    parser.add_argument("--host", default=os.environ.get("REDIS_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("REDIS_PORT", 6379)))
+    parser.add_argument("--db", type=int, default=0)
+    parser.add_argument("--scan-count", type=int, default=1000)
+    parser.add_argument("--no-memory", action="store_true", help="skip MEMORY USAGE calls and only count keys")
+    parser.add_argument("--expire-legacy", type=int, metavar="SECONDS",
+                        help="set a TTL on keys outside the chat:<id> schema that have none")
+    args = parser.parse_args()
+
+    redis_client = redis.Redis(host=args.host, port=args.port, db=args.db)
+    if args.expire_legacy:
+        expired = expire_legacy_keys(redis_client, args.expire_legacy, args.scan_count)
+        print(f"Set a {args.expire_legacy}s TTL on up to {expired} legacy keys")
+    print_stats(collect_stats(redis_client, args.scan_count, with_memory=not args.no_memory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+UPDATES_STREAM_PREFIX = "updates"
+UPDATES_GROUP = "handlers"
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_chat_id(update):
+    message = getattr(update, "message", None) or getattr(update, "edited_message", None)
+    if message is not None:
+        return message.chat.id
+    callback_query = getattr(update, "callback_query", None)
+    if callback_query is not None:
+        if callback_query.message is not None:
+            return callback_query.message.chat.id
+        return callback_query.from_user.id
+    for name in ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query"):
+        event = getattr(update, name, None)
+        if event is not None:
+            return event.from_user.id
+    return update.update_id
+
+
+def shard_for(chat_id, shards):
+    return int(chat_id) % shards
+
+
+def stream_key(shard):
+    return f"{UPDATES_STREAM_PREFIX}:{shard}"
+
+
+class ChatDispatcher:
+    def __init__(self, handle, max_workers=20, max_pending=10000):
+        self.handle = handle
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="handler")
+        self.pending = asyncio.Semaphore(max_pending)
+        self.queues = {}
+        self.tasks = set()
+
+    async def submit(self, chat_id, update):
+        await self.pending.acquire()
+        queue = self.queues.get(chat_id)
+        if queue is None:
+            queue = self.queues[chat_id] = asyncio.Queue()
+            task = asyncio.create_task(self.run_chat(chat_id, queue))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        queue.put_nowait(update)
+
+    async def run_chat(self, chat_id, queue):
+        loop = asyncio.get_running_loop()
+        while not queue.empty():
+            update = queue.get_nowait()
+            try:
+                await loop.run_in_executor(self.executor, self.handle, update)
+            except Exception as e:
+                logger.exception(f"Error while handling update for chat {chat_id}: {e}")
+            finally:
+                self.pending.release()
+        del self.queues[chat_id]
+
+    async def drain(self):
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class PollingRuntime:
+    def __init__(self, bot, max_workers=20, max_pending=10000, limit=100, timeout=20, allowed_updates=None):
+        bot.threaded = False
+        self.bot = bot
+        self.limit = limit
+        self.timeout = timeout
+        self.allowed_updates = allowed_updates
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.poll_executor = None
+        self.stopped = None
+        self.dispatcher = None
+
+    def handle(self, update):
+        self.bot.process_new_updates([update])
+
+    async def get_updates(self, offset):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.poll_executor, lambda: self.bot.get_updates(
+            offset=offset, limit=self.limit, timeout=self.timeout,
+            allowed_updates=self.allowed_updates, long_polling_timeout=self.timeout))
+
+    async def run(self):
+        self.stopped = asyncio.Event()
+        self.poll_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="poller")
+        self.dispatcher = ChatDispatcher(self.handle, self.max_workers, self.max_pending)
+        offset = None
+        logger.info(f"Polling runtime started with {self.max_workers} handler workers")
+        try:
+            while not self.stopped.is_set():
+                try:
+                    updates = await self.get_updates(offset)
+                except Exception as e:
+                    logger.error(f"Error while polling for updates: {e}")
+                    await asyncio.sleep(2)
+                    continue
+                for update in updates:
+                    offset = update.update_id + 1
+                    await self.dispatcher.submit(update_chat_id(update), update)
+            await self.dispatcher.drain()
+        finally:
+            self.dispatcher.shutdown()
+            self.poll_executor.shutdown(wait=False)
+
+    def stop(self):
+        if self.stopped is not None:
+            self.stopped.set()
+
+
+class RedisUpdateQueue:
+    def __init__(self, redis_client, shards, max_length=100000):
+        self.redis_client = redis_client
+        self.shards = shards
+        self.max_length = max_length
+
+    def publish(self, chat_id, raw_update):
+        self.redis_client.xadd(stream_key(shard_for(chat_id, self.shards)), {"update": raw_update},
+                               maxlen=self.max_length, approximate=True)
+
+
+class WebhookRuntime:
+    def __init__(self, bot, url, secret_token, host="0.0.0.0", port=8443, path="/telegram",
+                 queue=None, max_workers=20, max_pending=10000, allowed_updates=None):
+        bot.threaded = False
+        self.bot = bot
+        self.url = url
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.path = path
+        self.queue = queue
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.allowed_updates = allowed_updates
+        self.publish_executor = None
+        self.dispatcher = None
+
+    def handle(self, update):
+        self.bot.process_new_updates([update])
+
+    async def receive(self, request):
+        from aiohttp import web
+
+        if self.secret_token and request.headers.get(SECRET_TOKEN_HEADER) != self.secret_token:
+            return web.Response(status=403)
+        raw_update = await request.text()
+        update = types.Update.de_json(raw_update)
+        chat_id = update_chat_id(update)
+        if self.queue is None:
+            await self.dispatcher.submit(chat_id, update)
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.publish_executor, self.queue.publish, chat_id, raw_update)
+        return web.Response()
+
+    async def run(self):
+        from aiohttp import web
+
+        self.publish_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="publisher")
+        if self.queue is None:
+            self.dispatcher = ChatDispatcher(self.handle, self.max_workers, self.max_pending)
+        app = web.Application()
+        app.router.add_post(self.path, self.receive)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, self.host, self.port)
+        await site.start()
+        self.bot.set_webhook(url=self.url, secret_token=self.secret_token, allowed_updates=self.allowed_updates)
+        logger.info(f"Webhook runtime listening on {self.host}:{self.port}{self.path}, "
+                    f"{'in-process' if self.queue is None else 'redis stream'} queue")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+            if self.dispatcher is not None:
+                await self.dispatcher.drain()
+                self.dispatcher.shutdown()
+            self.publish_executor.shutdown(wait=False)
+
+
+class StreamWorker:
+    def __init__(self, bot, redis_client, shards, consumer=None, max_workers=20, max_pending=10000, batch_size=100, block_ms=5000):
+        if not shards:
+            raise ValueError("StreamWorker needs at least one shard")
+        bot.threaded = False
+        self.bot = bot
+        self.redis_client = redis_client
+        self.shards = list(shards)
+        self.consumer = consumer or socket.gethostname()
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.poll_executor = None
+        self.stopped = None
+        self.dispatcher = None
+
+    def create_groups(self):
+        for shard in self.shards:
+            try:
+                self.redis_client.xgroup_create(stream_key(shard), UPDATES_GROUP, id="0", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    def handle(self, entry):
+        key, entry_id, update = entry
+        try:
+            self.bot.process_new_updates([update])
+        finally:
+            self.redis_client.xack(key, UPDATES_GROUP, entry_id)
+
+    def read(self, last_ids):
+        streams = self.redis_client.xreadgroup(UPDATES_GROUP, self.consumer, last_ids,
+                                               count=self.batch_size, block=self.block_ms)
+        entries = []
+        for key, messages in streams or []:
+            key = key.decode("utf-8") if isinstance(key, bytes) else key
+            if last_ids[key] != ">" and not messages:
+                last_ids[key] = ">"
+            for entry_id, fields in messages:
+                if last_ids[key] != ">":
+                    last_ids[key] = entry_id
+                entries.append((key, entry_id, fields[b"update"].decode("utf-8")))
+        return entries
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.poll_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream-reader")
+        self.dispatcher = ChatDispatcher(self.handle, self.max_workers, self.max_pending)
+        self.create_groups()
+        last_ids = {stream_key(shard): "0" for shard in self.shards}
+        logger.info(f"Stream worker {self.consumer} consuming shards {self.shards} with {self.max_workers} handler workers")
+        try:
+            while not self.stopped.is_set():
+                try:
+                    entries = await loop.run_in_executor(self.poll_executor, self.read, last_ids)
+                except redis.RedisError as e:
+                    logger.error(f"Error while reading update streams: {e}")
+                    await asyncio.sleep(2)
+                    continue
+                for key, entry_id, raw_update in entries:
+                    update = types.Update.de_json(raw_update)
+                    await self.dispatcher.submit(update_chat_id(update), (key, entry_id, update))
+            await self.dispatcher.drain()
+        finally:
+            self.dispatcher.shutdown()
+            self.poll_executor.shutdown(wait=False)
+
+    def stop(self):
+        if self.stopped is not None:
+            self.stopped.set()
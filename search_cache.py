@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+from math import radians, cos, floor, hypot
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+METERS_PER_DEGREE = 111111
+
+
+class SearchCache:
+    def __init__(self, redis_client, radius_buckets, cell_meters=250, ttl_seconds=3600,
+                 reference_latitude=50.45, prefix="search_cache", version_check_seconds=5):
+        self.redis_client = redis_client
+        self.radius_buckets = sorted(int(radius) for radius in radius_buckets)
+        self.cell_meters = cell_meters
+        self.ttl_seconds = ttl_seconds
+        self.lat_step = cell_meters / METERS_PER_DEGREE
+        self.lon_step = cell_meters / (METERS_PER_DEGREE * cos(radians(reference_latitude)))
+        self.prefix = prefix
+        self.version_key = f"{prefix}:version"
+        self.version_check_seconds = version_check_seconds
+        self.version = None
+        self.version_checked = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def cell_radius_meters(self):
+        return hypot(self.cell_meters, self.cell_meters) / 2
+
+    def cell_for(self, latitude, longitude):
+        return (floor(latitude / self.lat_step), floor(longitude / self.lon_step))
+
+    def cell_center(self, cell):
+        return ((cell[0] + 0.5) * self.lat_step, (cell[1] + 0.5) * self.lon_step)
+
+    def radius_bucket(self, radius):
+        for bucket in self.radius_buckets:
+            if radius <= bucket:
+                return bucket
+        return int(radius)
+
+    def current_version(self):
+        now = time.monotonic()
+        if self.version is None or now - self.version_checked >= self.version_check_seconds:
+            version = self.redis_client.get(self.version_key)
+            self.version = version.decode("utf-8") if version is not None else "0"
+            self.version_checked = now
+        return self.version
+
+    def key(self, cell, radius_bucket, place_type):
+        return f"{self.prefix}:{self.current_version()}:{cell[0]}:{cell[1]}:{radius_bucket}:{place_type}"
+
+    def get(self, cell, radius_bucket, place_type):
+        try:
+            value = self.redis_client.get(self.key(cell, radius_bucket, place_type))
+        except redis.RedisError as e:
+            logger.error(f"Search cache read failed: {e}")
+            with self.lock:
+                self.errors += 1
+            return None
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return value.decode("utf-8").split(",") if value else []
+
+    def set(self, cell, radius_bucket, place_type, place_ids):
+        try:
+            self.redis_client.set(self.key(cell, radius_bucket, place_type), ",".join(place_ids), ex=self.ttl_seconds)
+        except redis.RedisError as e:
+            logger.error(f"Search cache write failed: {e}")
+            with self.lock:
+                self.errors += 1
+
+    def invalidate(self):
+        self.redis_client.incr(self.version_key)
+        self.version = None
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,135 @@
+import json
+import logging
+import struct
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL_SECONDS = 24 * 60 * 60
+CHAT_KEY_PREFIX = "chat"
+
+PLACE_REF_DISTANCE = struct.Struct("<I")
+
+try:
+    import msgpack
+
+    SESSION_ENCODING = "msgpack"
+
+    def encode(value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(data):
+        return msgpack.unpackb(data, raw=False)
+except ImportError:
+    SESSION_ENCODING = "json"
+
+    def encode(value):
+        return json.dumps(value, separators=(",", ":"))
+
+    def decode(data):
+        return json.loads(data)
+
+
+def pack_place_ref(place_ref):
+    place_id, distance = place_ref
+    return PLACE_REF_DISTANCE.pack(int(distance)) + place_id.encode("utf-8")
+
+
+def unpack_place_ref(data):
+    return data[PLACE_REF_DISTANCE.size:].decode("utf-8"), PLACE_REF_DISTANCE.unpack_from(data)[0]
+
+
+def chat_key(chat_id):
+    return f"{CHAT_KEY_PREFIX}:{chat_id}"
+
+
+def list_key(chat_id, name):
+    return f"{CHAT_KEY_PREFIX}:{chat_id}:{name}"
+
+
+class SessionStore:
+    def __init__(self, redis_client, ttl_seconds=SESSION_TTL_SECONDS):
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, chat_id, field):
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hget(chat_key(chat_id), field)
+        pipe.expire(chat_key(chat_id), self.ttl_seconds)
+        return pipe.execute()[0]
+
+    def set(self, chat_id, field, value):
+        self.set_many(chat_id, {field: value})
+
+    def set_many(self, chat_id, mapping):
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hset(chat_key(chat_id), mapping=mapping)
+        pipe.expire(chat_key(chat_id), self.ttl_seconds)
+        pipe.execute()
+
+    def exists(self, chat_id, field):
+        return bool(self.redis_client.hexists(chat_key(chat_id), field))
+
+    def delete(self, chat_id, *fields):
+        self.redis_client.hdel(chat_key(chat_id), *fields)
+
+    def pop(self, chat_id, field):
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.hget(chat_key(chat_id), field)
+        pipe.hdel(chat_key(chat_id), field)
+        return pipe.execute()[0]
+
+    def replace_list(self, chat_id, name, items, encoder=encode):
+        key = list_key(chat_id, name)
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.delete(key)
+        if items:
+            pipe.rpush(key, *[encoder(item) for item in items])
+            pipe.expire(key, self.ttl_seconds)
+        pipe.execute()
+        return len(items)
+
+    def append(self, chat_id, name, values):
+        if not values:
+            return
+        key = list_key(chat_id, name)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.rpush(key, *values)
+        pipe.expire(key, self.ttl_seconds)
+        pipe.execute()
+
+    def pop_list(self, chat_id, name):
+        key = list_key(chat_id, name)
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.lrange(key, 0, -1)
+        pipe.delete(key)
+        return pipe.execute()[0]
+
+    def delete_list(self, chat_id, name):
+        self.redis_client.delete(list_key(chat_id, name))
+
+    def page(self, chat_id, name, start, stop, decoder=decode):
+        key = list_key(chat_id, name)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.lrange(key, start, stop - 1)
+        pipe.llen(key)
+        pipe.expire(key, self.ttl_seconds)
+        items, length, _ = pipe.execute()
+        return [decoder(item) for item in items], length
+
+    def item(self, chat_id, name, index, decoder=decode):
+        key = list_key(chat_id, name)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.lindex(key, index)
+        pipe.llen(key)
+        pipe.expire(key, self.ttl_seconds)
+        item, length, _ = pipe.execute()
+        return (decoder(item) if item is not None else None), length
+
+    def replace_place_refs(self, chat_id, name, place_refs):
+        return self.replace_list(chat_id, name, place_refs, encoder=pack_place_ref)
+
+    def place_refs_page(self, chat_id, name, start, stop):
+        return self.page(chat_id, name, start, stop, decoder=unpack_place_ref)
+
+    def place_ref(self, chat_id, name, index):
+        return self.item(chat_id, name, index, decoder=unpack_place_ref)
@@ -0,0 +1,134 @@
+import logging
+import threading
+from math import radians, cos, floor
+
+from opening_hours import unpack_intervals
+
+logger = logging.getLogger(__name__)
+
+METERS_PER_DEGREE = 111111
+
+PLACES_QUERY = """
+SELECT place_id, latitude, longitude, name, types, formatted_address, open_intervals
+FROM Places
+WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+"""
+
+
+class SpatialIndex:
+    def __init__(self, cell_size_meters=500, reference_latitude=50.45):
+        self.cell_size_meters = cell_size_meters
+        self.lat_step = cell_size_meters / METERS_PER_DEGREE
+        self.lon_step = cell_size_meters / (METERS_PER_DEGREE * cos(radians(reference_latitude)))
+        self.lock = threading.RLock()
+        self.places = {}
+        self.cells = {}
+        self.refresh_thread = None
+        self.stop_event = threading.Event()
+
+    def cell_for(self, latitude, longitude):
+        return (floor(latitude / self.lat_step), floor(longitude / self.lon_step))
+
+    def __len__(self):
+        return len(self.places)
+
+    def get(self, place_id):
+        return self.places.get(place_id)
+
+    def upsert(self, place_id, latitude, longitude, name, types, formatted_address, open_intervals=None):
+        with self.lock:
+            self._remove(place_id)
+            if latitude is None or longitude is None:
+                return
+            entry = (place_id, float(latitude), float(longitude), name, types or '', formatted_address,
+                     unpack_intervals(open_intervals))
+            self.places[place_id] = entry
+            self.cells.setdefault(self.cell_for(entry[1], entry[2]), []).append(entry)
+
+    def remove(self, place_id):
+        with self.lock:
+            self._remove(place_id)
+
+    def _remove(self, place_id):
+        entry = self.places.pop(place_id, None)
+        if entry is None:
+            return
+        cell_key = self.cell_for(entry[1], entry[2])
+        cell = self.cells.get(cell_key)
+        if cell is not None:
+            cell.remove(entry)
+            if not cell:
+                del self.cells[cell_key]
+
+    def build(self, rows):
+        places = {}
+        cells = {}
+        for place_id, latitude, longitude, name, types, formatted_address, open_intervals in rows:
+            if latitude is None or longitude is None:
+                continue
+            entry = (place_id, float(latitude), float(longitude), name, types or '', formatted_address,
+                     unpack_intervals(open_intervals))
+            places[place_id] = entry
+            cells.setdefault(self.cell_for(entry[1], entry[2]), []).append(entry)
+        with self.lock:
+            self.places = places
+            self.cells = cells
+
+    def load(self, pool):
+        with pool.cursor() as cursor:
+            cursor.execute(PLACES_QUERY)
+            rows = cursor.fetchall()
+        self.build(rows)
+        logger.info(f"Spatial index loaded {len(self.places)} places into {len(self.cells)} cells")
+
+    def refresh(self, pool, place_ids):
+        place_ids = list(place_ids)
+        if not place_ids:
+            return
+        placeholders = ", ".join(["%s"] * len(place_ids))
+        query = f"SELECT place_id, latitude, longitude, name, types, formatted_address, open_intervals FROM Places WHERE place_id IN ({placeholders})"
+        with pool.cursor() as cursor:
+            cursor.execute(query, place_ids)
+            rows = cursor.fetchall()
+        found = set()
+        for row in rows:
+            self.upsert(*row)
+            found.add(row[0])
+        for place_id in place_ids:
+            if place_id not in found:
+                self.remove(place_id)
+        logger.info(f"Spatial index refreshed {len(found)} places, removed {len(place_ids) - len(found)}")
+
+    def start_auto_refresh(self, pool, interval_seconds):
+        def run():
+            while not self.stop_event.wait(interval_seconds):
+                try:
+                    self.load(pool)
+                except Exception as e:
+                    logger.error(f"Error while reloading spatial index: {e}")
+
+        self.refresh_thread = threading.Thread(target=run, name="spatial-index-refresh", daemon=True)
+        self.refresh_thread.start()
+
+    def stop_auto_refresh(self):
+        self.stop_event.set()
+
+    def candidates(self, latitude, longitude, range_meters):
+        lat_delta = range_meters / METERS_PER_DEGREE
+        lon_delta = range_meters / (METERS_PER_DEGREE * cos(radians(latitude)))
+        min_lat = latitude - lat_delta
+        max_lat = latitude + lat_delta
+        min_lon = longitude - lon_delta
+        max_lon = longitude + lon_delta
+        min_cell = self.cell_for(min_lat, min_lon)
+        max_cell = self.cell_for(max_lat, max_lon)
+
+        with self.lock:
+            cells = self.cells
+            result = []
+            for lat_cell in range(min_cell[0], max_cell[0] + 1):
+                for lon_cell in range(min_cell[1], max_cell[1] + 1):
+                    for entry in cells.get((lat_cell, lon_cell), ()):
+                        if min_lat <= entry[1] <= max_lat and min_lon <= entry[2] <= max_lon:
+                            result.append(entry)
+        return result